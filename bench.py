@@ -0,0 +1,286 @@
+# Benchmarks for slices.py
+#
+# Times the hot paths (parsing, closest-vertex seeding, tiling one
+# pair, meshing a whole stack, bulk normals) on femurSlices.dat and on
+# synthetic contours and stacks, without opening a window.  Each case
+# reports its best and mean time over the repeats, the peak memory
+# traced in one extra run, and triangles per second where it makes
+# triangles.
+#
+# Usage: python bench.py                         (all cases, printed as a table)
+#        python bench.py -o results.json         (also save the results as JSON)
+#        python bench.py --compare old.json      (show the time ratio to an earlier run)
+#        python bench.py --quick                 (small sizes only)
+#        python bench.py -k stack                (only cases whose name contains 'stack')
+
+import sys, os, io, math, json, time, platform, argparse, tracemalloc
+
+import slices
+
+
+femurFile = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), 'femurSlices.dat' )
+
+
+# Synthetic data
+#
+# A contour is a wobbly ellipse of n points in the plane at height y,
+# in RH order around the +y axis like the slices in a slice file.
+# 'phase' turns the wobble so that adjacent contours differ.
+
+def syntheticContour( n, y=0.0, radius=20.0, phase=0.0 ):
+
+    points = []
+
+    for i in range(n):
+        angle = 2 * math.pi * i / n
+        r     = radius * (1 + 0.15 * math.sin( 5*angle + phase ) + 0.05 * math.cos( 13*angle - phase ))
+        points.append( [ 1.3 * r * math.cos( angle ), y, -r * math.sin( angle ) ] )
+
+    return points
+
+
+# A stack of slices, top first, one unit apart, whose point counts
+# vary a little from slice to slice around 'numPoints'
+
+def syntheticStack( numSlices, numPoints ):
+
+    stack = []
+
+    for s in range(numSlices):
+        n = max( 3, int( numPoints * (1 + 0.1 * math.sin( 0.7*s )) ) )
+        stack.append( slices.Slice( syntheticContour( n, (numSlices-1)/2.0 - s, 20.0 + 3 * math.sin( 0.2*s ), 0.3*s ) ) )
+
+    return stack
+
+
+# The same stack as the text of a slice file
+
+def sliceFileText( stack ):
+
+    lines = [ '%d' % len(stack) ]
+
+    for slice in reversed( stack ): # files are bottom first
+        lines.append( '%d' % slice.numVerts() )
+        lines.extend( '%r %r %r' % tuple(p) for p in slices.asPointList( slice.coords ) )
+
+    return ( '\n'.join( lines ) + '\n' ).encode()
+
+
+# Benchmark cases
+#
+# Each case is ( name, params, setup ) where setup() returns a function
+# to time.  The timed function returns the number of triangles it made
+# (or None).  Setup is not timed.
+
+def parseCases( quick ):
+
+    cases = []
+
+    def parser( data ):
+        def run():
+            slices.readSlices( io.BytesIO( data ) )
+        return run
+
+    def readFemur():
+        with open( femurFile, 'rb' ) as f:
+            return parser( f.read() )
+
+    cases.append( ( 'parse femur', { 'file': 'femurSlices.dat' }, readFemur ) )
+
+    for numSlices in ( (10, 100) if quick else (10, 100, 1000) ):
+
+        def readStack( numSlices=numSlices ):
+            return parser( sliceFileText( syntheticStack( numSlices, 300 ) ) )
+
+        cases.append( ( 'parse stack', { 'slices': numSlices, 'points': 300 }, readStack ) )
+
+    return cases
+
+
+def seedCases( quick ):
+
+    cases = []
+
+    for n in ( (100, 1000) if quick else (100, 1000, 10000) ):
+
+        def closest( n=n ):
+            pts0 = syntheticContour( n, 0.5, 20.0, 0.0 )
+            pts1 = syntheticContour( n, -0.5, 21.0, 0.4 )
+            def run():
+                slices.findClosestVertices( pts0, pts1 )
+            return run
+
+        cases.append( ( 'closest vertices', { 'points': n }, closest ) )
+
+    return cases
+
+
+def pairCases( quick, backends ):
+
+    cases = []
+
+    for n in ( (100, 1000) if quick else (100, 1000, 10000) ):
+
+        coords0 = slices.makeCoords( syntheticContour( n, 0.5, 20.0, 0.0 ) )
+        coords1 = slices.makeCoords( syntheticContour( n + n//10, -0.5, 21.0, 0.4 ) )
+
+        for backend in backends:
+
+            if n > 3000 and backend != 'numpy-packed':
+                continue # the full table is too big, and the pure-Python fill too slow (minutes), to be worth timing here
+
+            def tile( backend=backend, coords0=coords0, coords1=coords1 ):
+                return lambda: len( slices.tilePair( coords0, coords1, backend ) )
+
+            cases.append( ( 'tile pair', { 'points': n, 'backend': backend }, tile ) )
+
+        def tileBanded( coords0=coords0, coords1=coords1 ):
+            return lambda: len( slices.tilePair( coords0, coords1, band=16 ) )
+
+        cases.append( ( 'tile pair banded', { 'points': n, 'band': 16 }, tileBanded ) )
+
+    return cases
+
+
+def stackCases( quick, workers ):
+
+    cases = []
+
+    def meshFemur( workers ):
+        stack = slices.loadSlices( femurFile )
+        return lambda: slices.buildMesh( stack, workers=workers ).numTriangles()
+
+    cases.append( ( 'mesh femur', { 'workers': 1 }, lambda: meshFemur( 1 ) ) )
+
+    workers = workers or os.cpu_count() or 1
+    if workers != 1: # peak memory is only traced in this process
+        cases.append( ( 'mesh femur', { 'workers': workers }, lambda: meshFemur( workers ) ) )
+
+    for numSlices in ( (10, 100) if quick else (10, 100, 1000) ):
+
+        def meshStack( numSlices=numSlices ):
+            stack = syntheticStack( numSlices, 100 )
+            return lambda: slices.buildMesh( stack ).numTriangles()
+
+        cases.append( ( 'mesh stack', { 'slices': numSlices, 'points': 100 }, meshStack ) )
+
+    def normals():
+        mesh = slices.buildMesh( slices.loadSlices( femurFile ) )
+        def run():
+            mesh.normals = None
+            mesh.faceNormals()
+            return mesh.numTriangles()
+        return run
+
+    cases.append( ( 'face normals femur', {}, normals ) )
+
+    return cases
+
+
+# Run one case: time 'repeat' runs, then trace memory in one more
+
+def runCase( name, params, setup, repeat ):
+
+    run = setup()
+
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        triangles = run()
+        times.append( time.perf_counter() - start )
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = min( times )
+
+    return { 'name':         name,
+             'params':       params,
+             'best':         best,
+             'mean':         sum( times ) / len( times ),
+             'repeat':       repeat,
+             'peakBytes':    peak,
+             'triangles':    triangles,
+             'trianglesPerSec': triangles / best if triangles and best > 0 else None }
+
+
+def caseKey( result ):
+
+    return result['name'] + ' ' + json.dumps( result['params'], sort_keys=True )
+
+
+def describe( result ):
+
+    params = ', '.join( '%s=%s' % (k, result['params'][k]) for k in sorted( result['params'] ) )
+    return '%s (%s)' % (result['name'], params) if params else result['name']
+
+
+def printHeader( previous ):
+
+    print( '%-50s %10s %10s %10s %12s%s' % ('case', 'best s', 'mean s', 'peak MB', 'tris/s', '   vs old' if previous else '') )
+
+
+def printResult( result, previous ):
+
+    line = '%-50s %10.4f %10.4f %10.1f %12s' % (describe( result ), result['best'], result['mean'], result['peakBytes'] / 1e6,
+                                              '%.0f' % result['trianglesPerSec'] if result['trianglesPerSec'] else '-')
+
+    old = previous.get( caseKey( result ) )
+    if old is not None:
+        line += '   %.2fx' % (result['best'] / old['best'])
+
+    print( line )
+    sys.stdout.flush()
+
+
+
+def main():
+
+    parser = argparse.ArgumentParser( description='Benchmark slice parsing, seeding, tiling and meshing.' )
+    parser.add_argument( '-o', '--output', help='write the results to this JSON file' )
+    parser.add_argument( '--compare', metavar='JSON', help='show each time as a ratio to the same case in an earlier run' )
+    parser.add_argument( '-k', '--keyword', help='only run cases whose name contains this' )
+    parser.add_argument( '-r', '--repeat', type=int, default=3, help='timed runs per case (default 3)' )
+    parser.add_argument( '-j', '--workers', type=int, default=1, help='also mesh the femur with this many processes (0 for one per CPU)' )
+    parser.add_argument( '--quick', action='store_true', help='skip the largest sizes' )
+    args = parser.parse_args()
+
+    backends = sorted( b for b in slices.fillBackends if slices.np is not None or not b.startswith( 'numpy' ) )
+
+    cases = ( parseCases( args.quick ) + seedCases( args.quick ) +
+              pairCases( args.quick, backends ) + stackCases( args.quick, args.workers or None ) )
+
+    if args.keyword:
+        cases = [ case for case in cases if args.keyword in case[0] ]
+
+    previous = {}
+    if args.compare:
+        with open( args.compare ) as f:
+            previous = { caseKey( result ): result for result in json.load( f )['results'] }
+
+    printHeader( previous )
+
+    results = []
+    for name, params, setup in cases:
+        results.append( runCase( name, params, setup, args.repeat ) )
+        printResult( results[-1], previous )
+
+    if args.output:
+
+        report = { 'python':  platform.python_version(),
+                   'numpy':   slices.np.__version__ if slices.np is not None else None,
+                   'machine': platform.machine(),
+                   'time':    time.strftime( '%Y-%m-%dT%H:%M:%S' ),
+                   'results': results }
+
+        with open( args.output, 'w' ) as f:
+            json.dump( report, f, indent=1 )
+
+        print( 'Wrote %d results to %s' % (len(results), args.output) )
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+# Vector geometry for slices.py and viewer.py
+#
+# The single-vector functions (add(), crossProduct(), ...) take and
+# return [x,y,z] lists, making a new list per call.  They are for a
+# few vectors at a time, such as the viewer's camera, and for the
+# pure-Python reference DP.
+#
+# The batched kernels (adds(), crossProducts(), ...) work on many
+# points at once: an (N,3) NumPy array, or without NumPy a list of
+# [x,y,z].  Either argument of a two-argument kernel may be a single
+# point, which is paired with every point of the other (with NumPy,
+# any shapes that broadcast).  Results are arrays with NumPy and lists
+# without.  Each kernel does its arithmetic in the same order as its
+# single-vector version, so that both give identical results.
+#
+# The closed-loop kernels (edgeVectors(), contourLength(),
+# contourArea(), ...) treat an (N,3) buffer as a closed contour, its
+# last point joined to its first.
+
+import math
+
+try: # NumPy (optional; without it the kernels loop in Python)
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Single vectors
+
+
+def add( v0, v1 ):
+
+    return [ v0[0]+v1[0], v0[1]+v1[1], v0[2]+v1[2] ]
+
+
+def subtract( v0, v1 ):
+
+    return [ v0[0]-v1[0], v0[1]-v1[1], v0[2]-v1[2] ]
+
+
+def scalarMult( k, v ):
+
+    return [ k*v[0], k*v[1], k*v[2] ]
+
+
+def dotProduct( v0, v1 ):
+
+    return v0[0]*v1[0] + v0[1]*v1[1] + v0[2]*v1[2]
+
+
+def crossProduct( v0, v1 ):
+
+    return [ v0[1]*v1[2] - v0[2]*v1[1], v0[2]*v1[0] - v0[0]*v1[2], v0[0]*v1[1] - v0[1]*v1[0] ]
+
+
+def length( v ):
+
+    return math.sqrt( v[0]*v[0] + v[1]*v[1] + v[2]*v[2] )
+
+
+def normalize( v ):
+
+    d = length( v )
+
+    if d > 0.0001:
+        return [ v[0]/d, v[1]/d, v[2]/d ]
+    else:
+        return v
+
+
+def triangleArea( v0, v1, v2 ):
+
+    return 0.5 * length( crossProduct( subtract( v1, v0 ), subtract( v2, v0 ) ) )
+
+
+# Rotate v by angle about axis (axis must be unit length), by
+# Rodrigues' formula
+
+def rotateVector( v, angle, axis ):
+
+    cosAngle = math.cos(angle)
+    sinAngle = math.sin(angle)
+
+    cross = crossProduct( axis, v )
+    dot   = dotProduct( axis, v ) * (1 - cosAngle)
+
+    return [ v[0] * cosAngle + cross[0] * sinAngle + axis[0] * dot,
+             v[1] * cosAngle + cross[1] * sinAngle + axis[1] * dot,
+             v[2] * cosAngle + cross[2] * sinAngle + axis[2] * dot ]
+
+
+
+# Batched kernels
+
+
+# Points as a float64 NumPy array (not copied if they already are one)
+
+def pointArray( v ):
+
+    return np.asarray( v, dtype=np.float64 )
+
+
+# Without NumPy: is v one [x,y,z] rather than a list of them?
+
+def isPoint( v ):
+
+    return len(v) == 3 and not isinstance( v[0], (list, tuple) )
+
+
+# Without NumPy: the (p, q) pairs to apply a two-argument kernel to
+
+def pointPairs( v0, v1 ):
+
+    if isPoint( v0 ) and isPoint( v1 ):
+        return [ (v0, v1) ]
+    elif isPoint( v0 ):
+        return [ (v0, q) for q in v1 ]
+    elif isPoint( v1 ):
+        return [ (p, v1) for p in v0 ]
+    else:
+        return zip( v0, v1 )
+
+
+def adds( v0, v1 ):
+
+    if np is not None:
+        return pointArray( v0 ) + pointArray( v1 )
+    else:
+        return [ add( p, q ) for p, q in pointPairs( v0, v1 ) ]
+
+
+def subtracts( v0, v1 ):
+
+    if np is not None:
+        return pointArray( v0 ) - pointArray( v1 )
+    else:
+        return [ subtract( p, q ) for p, q in pointPairs( v0, v1 ) ]
+
+
+def scalarMults( k, v ):
+
+    if np is not None:
+        return k * pointArray( v )
+    else:
+        return [ scalarMult( k, p ) for p in v ]
+
+
+def dotProducts( v0, v1 ):
+
+    if np is not None:
+        v0 = pointArray( v0 )
+        v1 = pointArray( v1 )
+        return v0[...,0]*v1[...,0] + v0[...,1]*v1[...,1] + v0[...,2]*v1[...,2]
+    else:
+        return [ dotProduct( p, q ) for p, q in pointPairs( v0, v1 ) ]
+
+
+def crossProducts( v0, v1 ):
+
+    if np is not None:
+        v0 = pointArray( v0 )
+        v1 = pointArray( v1 )
+        return np.stack( [ v0[...,1]*v1[...,2] - v0[...,2]*v1[...,1],
+                           v0[...,2]*v1[...,0] - v0[...,0]*v1[...,2],
+                           v0[...,0]*v1[...,1] - v0[...,1]*v1[...,0] ], axis=-1 )
+    else:
+        return [ crossProduct( p, q ) for p, q in pointPairs( v0, v1 ) ]
+
+
+def lengths( v ):
+
+    if np is not None:
+        return np.sqrt( dotProducts( v, v ) )
+    else:
+        return [ length( p ) for p in v ]
+
+
+# Unit vectors along v, leaving (near) zero vectors as they are, as
+# normalize() does
+
+def normalizes( v ):
+
+    if np is not None:
+        v    = pointArray( v )
+        lens = lengths( v )
+        return v / np.where( lens > 0.0001, lens, 1.0 )[...,None]
+    else:
+        return [ normalize( p ) for p in v ]
+
+
+def triangleAreas( v0, v1, v2 ):
+
+    areas = lengths( crossProducts( subtracts( v1, v0 ), subtracts( v2, v0 ) ) )
+
+    if np is not None:
+        return 0.5 * areas
+    else:
+        return [ 0.5 * a for a in areas ]
+
+
+# Rotate each of v by angle about axis (see rotateVector())
+
+def rotateVectors( v, angle, axis ):
+
+    if np is None:
+        return [ rotateVector( p, angle, axis ) for p in v ]
+
+    v    = pointArray( v )
+    axis = pointArray( axis )
+
+    cosAngle = math.cos(angle)
+    sinAngle = math.sin(angle)
+
+    cross = crossProducts( axis, v )
+    dot   = dotProducts( axis, v ) * (1 - cosAngle)
+
+    return v * cosAngle + cross * sinAngle + axis * dot[...,None]
+
+
+# Mean of the points, as one [x,y,z]
+
+def centroid( v ):
+
+    if np is not None:
+        v = pointArray( v ).reshape( -1, 3 )
+        return ( v.sum( axis=0 ) * (1.0/len(v)) ).tolist()
+    else:
+        return scalarMult( 1.0/len(v), [ sum( p[i] for p in v ) for i in range(3) ] )
+
+
+
+# Closed loops
+
+
+# Vector from each point of a closed contour to the next
+
+def edgeVectors( coords ):
+
+    if np is not None:
+        pts = pointArray( coords ).reshape( -1, 3 )
+        return np.roll( pts, -1, axis=0 ) - pts
+    else:
+        return [ subtract( coords[(i+1) % len(coords)], coords[i] ) for i in range(len(coords)) ]
+
+
+# Perimeter of a closed contour
+
+def contourLength( coords ):
+
+    if np is not None:
+        return float( lengths( edgeVectors( coords ) ).sum() )
+    else:
+        return sum( lengths( edgeVectors( coords ) ) )
+
+
+# Vector area of a closed contour: normal to a planar contour, as long
+# as its area, and pointing along the axis that it goes around in RH
+# order.  Taken about the first point, to keep precision far from the
+# origin.
+
+def contourAreaVector( coords ):
+
+    if len(coords) == 0:
+        return [ 0.0, 0.0, 0.0 ]
+
+    if np is not None:
+        pts = pointArray( coords ).reshape( -1, 3 )
+        rel = pts - pts[0]
+        return ( 0.5 * crossProducts( rel, np.roll( rel, -1, axis=0 ) ).sum( axis=0 ) ).tolist()
+    else:
+        rel   = subtracts( coords, coords[0] )
+        cross = crossProducts( rel, rel[1:] + rel[:1] )
+        return scalarMult( 0.5, [ sum( c[i] for c in cross ) for i in range(3) ] )
+
+
+# Area of a closed contour seen along 'axis' (unit length): positive if
+# it goes around the axis in RH order, as slices in a slice file go
+# around +y, and negative if it goes the other way
+
+def contourArea( coords, axis=(0.0, 1.0, 0.0) ):
+
+    return dotProduct( contourAreaVector( coords ), axis )
+
+
+# +1 if a closed contour goes around 'axis' in RH order, -1 if the
+# other way, and 0 if it encloses no area
+
+def contourOrientation( coords, axis=(0.0, 1.0, 0.0) ):
+
+    area = contourArea( coords, axis )
+
+    return (area > 0) - (area < 0)
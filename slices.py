@@ -1,59 +1,195 @@
+# Min-area triangulation between slice contours
+#
+# This module has no OpenGL dependency so that slices can be read and
+# meshed headless.  The interactive viewer lives in viewer.py, and the
+# vector helpers and batched geometry kernels in geometry.py.
+#
+# Usage: python slices.py filename                 (view)
+#        python slices.py mesh filename -o out.ply  (mesh and save as PLY, STL or OBJ; -j N for N processes)
+#        python slices.py convert filename          (save as a binary slice stack)
+#
+# 'filename' can be an ASCII slice file or a binary slice stack.
+
+import sys, os, io, math, time, json, mmap, enum, struct, shutil, marshal, hashlib, tempfile, weakref, warnings, argparse, bisect, threading, collections, collections.abc, concurrent.futures
+
+try: # NumPy (optional; only the 'numpy' backend needs it)
+    import numpy as np
+except ImportError:
+    np = None
+
+from geometry import ( add, subtract, scalarMult, dotProduct, crossProduct, length, normalize, triangleArea,
+                       subtracts, dotProducts, crossProducts, lengths, normalizes, triangleAreas, centroid, contourLength, contourAreaVector )
+
+
+# Instrumentation
+#
+# Hot paths are wrapped in 'with timed( name ):' and call
+# counted( name, n ).  Until enableStats() is called these go to a
+# NoStats, which does nothing, so they cost about one function call.
+# Stats only sees work done in this process, not in worker processes.
+
+class Stats(object):
+
+    def __init__( self ):
+
+        self.timers = {} # name -> [ calls, total s, max s, last s ]
+        self.counts = {} # name -> count
+
+    def timer( self, name ):
+        return StatsTimer( self, name )
+
+    def addTime( self, name, seconds ):
+
+        timer = self.timers.get( name )
+        if timer is None:
+            timer = self.timers[name] = [ 0, 0.0, 0.0, 0.0 ]
+
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2]  = max( timer[2], seconds )
+        timer[3]  = seconds
+
+    def count( self, name, n=1 ):
+        self.counts[name] = self.counts.get( name, 0 ) + n
+
+    # Total time per timer, to subtract from a later one to see what
+    # happened in between
+
+    def totals( self ):
+        return { name: timer[1] for name, timer in self.timers.items() }
+
+    def report( self ):
+
+        return { 'timers': { name: { 'calls': calls, 'total': total, 'max': most, 'last': last }
+                             for name, (calls, total, most, last) in sorted( self.timers.items() ) },
+                 'counts': dict( sorted( self.counts.items() ) ) }
+
+    def dumpJSON( self, f ):
+
+        json.dump( self.report(), f, indent=1 )
+
+    # Write the timers in the format of cProfile's dump_stats(), so
+    # that pstats (e.g. 'python -m pstats file') can read them.  Each
+    # timer shows as a function of that name.
+
+    def dumpProfile( self, filename ):
+
+        profile = { ( 'slices', 0, name ): ( calls, calls, total, total, {} )
+                    for name, (calls, total, most, last) in self.timers.items() }
+
+        with open( filename, 'wb' ) as f:
+            marshal.dump( profile, f )
+
+
+class StatsTimer(object):
+
+    __slots__ = ( 'stats', 'name', 'start' )
+
+    def __init__( self, stats, name ):
+
+        self.stats = stats
+        self.name  = name
 
-haveGlutForFonts = False  
+    def __enter__( self ):
+        self.start = time.perf_counter()
 
-import sys, os, math, enum, pprint
+    def __exit__( self, *exc ):
+        self.stats.addTime( self.name, time.perf_counter() - self.start )
 
-try: # PyOpenGL
-    from OpenGL.GL import *
-    from OpenGL.GLU import *
-except:
-    print( 'Error: PyOpenGL has not been installed.' )
-    sys.exit(0)
 
-try: # GLFW
-    import glfw
-except:
-    print( 'Error: GLFW has not been installed.' )
-    sys.exit(0)
+class NoStats(object):
 
+    def __enter__( self ):
+        pass
 
-if haveGlutForFonts:
-    try: # GLUT
-      from OpenGL.GLUT import *
-    except:
-      print( 'Error: Could not import OpenGL.GLUT.  Set haveGlutForFonts = False unless you can install GLUT.' )
-      sys.exit(0)
+    def __exit__( self, *exc ):
+        pass
 
+    def timer( self, name ):
+        return self
 
-# Globals
+    def count( self, name, n=1 ):
+        pass
 
-windowWidth  = 800
-windowHeight = 800
-window       = None
+    def totals( self ):
+        return {}
 
-allSlices    = []
-allTriangles = []
 
-showCurrentSlice = False
-labelVerts       = False
-labelEdges       = False
-labelTris        = False
-currentSlice     = 0
+stats = NoStats()
+
+
+def timed( name ):
+    return stats.timer( name )
+
+
+def counted( name, n=1 ):
+    stats.count( name, n )
+
+
+# Start collecting stats (afresh) and return the Stats
+
+def enableStats():
+
+    global stats
+
+    stats = Stats()
+    return stats
+
+
+def disableStats():
+
+    global stats
+
+    stats = NoStats()
 
 
 # Vertex
+#
+# A vertex is a thin view of one row of its slice's coordinate buffer,
+# so that slices need no object per point.  The next vertex around the
+# slice is implicit (the next row, cyclically).  Vertex( [x,y,z] )
+# still makes a free-standing vertex, in a slice of its own.
 
 class Vertex(object):
 
+    __slots__ = ( 'slice', 'index' )
+
     nextID = 0
     
-    def __init__( self, coords ):
+    def __init__( self, coords, slice=None, index=0 ):
+
+        if slice is None:
+            slice = Slice( [ coords ] )
 
-        self.coords = coords   # [x,y,z] coordinates
-        self.nextV  = None     # next vertex in order around the slice
+        self.slice = slice  # slice holding this vertex
+        self.index = index  # row in slice.coords
 
-        self.id     = Vertex.nextID
-        Vertex.nextID += 1
+    # [x,y,z] coordinates
+
+    @property
+    def coords( self ):
+        return self.slice.point( self.index )
+
+    @coords.setter
+    def coords( self, coords ):
+        self.slice.coords[self.index] = [ float(x) for x in coords ]
+        self.slice.resetIndex()
+
+    # next vertex in order around the slice
+
+    @property
+    def nextV( self ):
+        return Vertex( None, self.slice, (self.index + 1) % self.slice.numVerts() )
+
+    @property
+    def id( self ):
+        return self.slice.firstVertexID + self.index
+
+    def __eq__( self, other ):
+        return isinstance( other, Vertex ) and self.slice is other.slice and self.index == other.index
+
+    def __hash__( self ):
+        return hash( (id(self.slice), self.index) )
 
     def __repr__( self ):
         return 'v%d' % self.id
@@ -61,15 +197,29 @@ class Vertex(object):
   
 # Slice
 #
-# Contains a 'verts' list, each item of which is a 3D vertex as [x,y,z]
+# Holds its vertices' coordinates in one buffer, 'coords': an (N,3)
+# float64 array, or a list of [x,y,z] lists if NumPy is not installed.
+# 'verts' gives Vertex views of the rows.
 
 class Slice(object):
 
     nextID = 0
     
-    def __init__( self, verts ):
+    def __init__( self, verts, copy=True ):
+
+        # 'verts' is a list of Vertex objects or [x,y,z] lists, or an
+        # (N,3) array, in RH order around +y axis.  A float64 array is
+        # used as is, rather than copied, if 'copy' is False.
 
-        self.verts     = verts  # [ v0, v1, v2, v3, ... ] in RH order around +y axis
+        if np is not None and isinstance( verts, np.ndarray ):
+            self.coords = (np.array if copy else np.asarray)( verts, dtype=np.float64 ).reshape( -1, 3 )
+        else:
+            self.coords = makeCoords( [ v.coords if isinstance( v, Vertex ) else v for v in verts ] )
+
+        self.index     = None   # KDTree over the vertex coordinates, built on first use
+
+        self.firstVertexID = Vertex.nextID
+        Vertex.nextID += len(self.coords)
 
         self.id        = Slice.nextID
         Slice.nextID += 1
@@ -77,672 +227,3186 @@ class Slice(object):
     def __repr__( self ):
         return 's%d' % self.id
 
-    # Draw this slice
-    
-    def draw(self):
+    # [ v0, v1, v2, v3, ... ] as Vertex views
 
-        glColor3f( 0, 0, 0 );
+    @property
+    def verts( self ):
+        return SliceVerts( self )
 
-        # Draw points
-        
-        # glBegin( GL_POINTS )
-        # for v in self.verts:
-        #     glVertex3fv( v.coords )
-        # glEnd()
+    def numVerts( self ):
+        return len(self.coords)
 
-        # Draw segments that fade from dark (0,0,0) at tail to light
-        # (1,1,1) at head so that direction can been seen.
+    # Coordinates of vertex i as a list of floats
 
-        glBegin( GL_LINES )
-        for v in self.verts:
-            glColor3f( 0,0,0 )
-            glVertex3fv( v.coords )
-            glColor3f( 1,1,1 )
-            glVertex3fv( v.nextV.coords )
-        glEnd()
+    def point( self, i ):
 
+        if np is not None and isinstance( self.coords, np.ndarray ):
+            return self.coords[i].tolist()
+        else:
+            return self.coords[i]
 
+    # Spatial index over this slice's vertices.  It is built once and
+    # kept, so call resetIndex() after moving or replacing vertices.
 
-# Triangle
+    def spatialIndex( self ):
 
-class Triangle(object):
+        if self.index is None:
+            self.index = KDTree( asPointList( self.coords ) )
+        return self.index
 
-    nextID = 0
-    
-    def __init__( self, verts ):
+    def resetIndex( self ):
 
-        self.verts = verts # [ v0, v1, v2 ] is CCW order as seen from outside the object
-        
-        self.norm  = normalize( crossProduct( subtract( verts[1].coords, verts[0].coords ), # outward-pointing normal
-                                              subtract( verts[2].coords, verts[0].coords ) ) )
+        self.index = None
 
-        self.id    = Triangle.nextID
-        Triangle.nextID += 1
+    # Vertex of this slice closest to point p
 
-    def __repr__( self ):
-        return 't%d' % self.id
+    def nearestVertex( self, p ):
 
-class Dir(enum.Enum):
-    PREV_ROW = 1
-    PREV_COL = 2
+        d2, i = self.spatialIndex().nearest( p )
+        return self.verts[i]
 
+    # Closest pair of vertices (v, w) with v in this slice and w in 'other'
 
-def buildTriangles( slice0, slice1 ):
+    def closestVertices( self, other ):
 
-    # Find the closest pair of vertices (one from each slice) to start with.
+        i0, i1 = findClosestVertices( asPointList( self.coords ), None, other.spatialIndex() )
+        return self.verts[i0], other.verts[i1]
 
-    def findClosestVertices(slice0, slice1):
-        # sort by x coordinate
-        slice0_sorted = sorted(slice0.verts, key=lambda v: v.coords[0])
-        slice1_sorted = sorted(slice1.verts, key=lambda v: v.coords[0])
-        min_distance = float('inf')
-        closest_pair = None
-        # sliding counter
-        j_start = 0 
-        # for each vertex in the first slice,
-        for v0 in slice0_sorted:
-            x0 = v0.coords[0] 
-            while j_start < len(slice1_sorted) and slice1_sorted[j_start].coords[0] < x0 - min_distance:
-                j_start += 1
-            # iterate through second slice and check distances
-            for j in range(j_start, len(slice1_sorted)):
-                v1 = slice1_sorted[j]
-                if v1.coords[0] > x0 + min_distance:
-                    break
-                diff = subtract(v0.coords, v1.coords)
-                distance_sq = dotProduct(diff, diff)
-                if distance_sq < min_distance:
-                    min_distance = distance_sq
-                    closest_pair = (v0, v1)
-                if min_distance == 0:
-                    return closest_pair
-
-        return closest_pair
-
-    # minV0    # closest vertex on top slice
-    # minV1    # closest vertex on bottom slice
-    minV0, minV1 = findClosestVertices(slice0, slice1)
-
-    start0 = slice0.verts.index(minV0)
-    start1 = slice1.verts.index(minV1)
-
-    verts0 = slice0.verts[start0:] + slice0.verts[:start0]
-    verts1 = slice1.verts[start1:] + slice1.verts[:start1]
-
-    verts0.append(verts0[0])
-    verts1.append(verts1[0])
-
-    minArea = [[0] * len(verts0) for _ in range(len(verts1))]
-    minDir  = [[None] * len(verts0) for _ in range(len(verts1))]
+    # A simpler copy of this slice, keeping only the vertices needed to
+    # stay within 'tolerance' of the contour (Douglas-Peucker)
 
+    def decimated( self, tolerance ):
 
-    minArea[0][0] = 0  # Starting edge has zero area
+        keep = decimateContour( self.coords, tolerance )
 
-    for c in range(1, len(verts0)):
-        minArea[0][c] = minArea[0][c - 1] + triangleArea(verts1[0].coords, verts0[c - 1].coords, verts0[c].coords)
-        minDir[0][c] = Dir.PREV_COL
-    
-    for r in range(1, len(verts1)):
-        minArea[r][0] = minArea[r - 1][0] + triangleArea(verts1[r - 1].coords, verts1[r].coords, verts0[0].coords)
-        minDir[r][0] = Dir.PREV_ROW
+        if np is not None and isinstance( self.coords, np.ndarray ):
+            return Slice( self.coords[keep] )
+        else:
+            return Slice( [ self.coords[i] for i in keep ] )
 
-    for r in range(1, len(verts1)):
-        for c in range(1, len(verts0)):
-            area_from_row = minArea[r - 1][c] + triangleArea(verts1[r - 1].coords, verts1[r].coords, verts0[c].coords)
-            area_from_col = minArea[r][c - 1] + triangleArea(verts1[r].coords, verts0[c - 1].coords, verts0[c].coords)
-            if minArea[r-1][c] < minArea[r][c-1]:
-                minArea[r][c] = area_from_row
-                minDir[r][c] = Dir.PREV_ROW
-            else:
-                minArea[r][c] = area_from_col
-                minDir[r][c] = Dir.PREV_COL
+    # A copy of this slice with 'count' vertices, or vertices about
+    # 'spacing' apart, evenly spaced along the contour from vertex 0
 
-    # Debugging
+    def resampled( self, count=None, spacing=None ):
 
-    # print minDir and minArea arrays in readable format
-    # print("               ", end="")
-    # for c in range(len(verts0)):
-    #     print(f"  {c:4}", end="")
-    # print()
-    # for r in range(len(verts1)):
-    #     print(f"{r:4}", end="   ")
-    #     for c in range(len(verts0)):
-    #         print(f"{minArea[r][c]:6.0f}", end=" ")
-    #         if minDir[r][c] == Dir.PREV_ROW:
-    #             print("|", end=" ")
-    #         elif minDir[r][c] == Dir.PREV_COL:
-    #             print("-", end=" ")
-    #         else:
-    #             print(" ", end=" ")
-    #     print()
+        if count is None:
+            if spacing is None:
+                raise ValueError( 'resampling needs a count or a spacing' )
+            count = int( round( contourLength( self.coords ) / spacing ) )
 
-    # Walk backward through the 'minDir' array to build triangulation.
+        return Slice( resampleContour( self.coords, max( 3, count ) ) )
 
-    triangles = []
-    r, c = len(verts1) - 1, len(verts0) - 1
 
-    # iterate backwards through array and append triangles
-    while r > 0 or c > 0:
-        if minDir[r][c] == Dir.PREV_ROW:
-            triangles.append(Triangle([verts1[r-1], verts1[r], verts0[c]]))
-            r -= 1
-        elif minDir[r][c] == Dir.PREV_COL:
-            triangles.append(Triangle([verts1[r], verts0[c-1], verts0[c]]))
-            c -= 1
+# The vertices of a slice, as a read-only sequence of Vertex views
+# made on demand.  Adding two of these (or one and a list) gives a list.
 
-    return triangles
+class SliceVerts(collections.abc.Sequence):
 
+    def __init__( self, slice ):
+        self.slice = slice
 
-# Set up the display and draw the current image
+    def __len__( self ):
+        return self.slice.numVerts()
 
-fovy  = 6     # field-of-view
-fNear = 10    # near plane
-fFar  = 10000 # far plane
+    def __getitem__( self, i ):
 
-eye    = [100,100,1000]
-lookat = [0,0,0]
-updir  = [0,1,0]
+        if isinstance( i, slice ):
+            return [ Vertex( None, self.slice, j ) for j in range( *i.indices( len(self) ) ) ]
 
-rotationAngle = None
-rotationAxis  = None
-fovyDelta     = None
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError( 'vertex index out of range' )
 
+        return Vertex( None, self.slice, i )
 
-def display( wait=False ):
+    def __add__( self, other ):
+        return list(self) + list(other)
 
-    # Handle any events that have occurred
+    def __radd__( self, other ):
+        return list(other) + list(self)
 
-    glfw.poll_events()
 
-    # Set up window
+# Coordinate buffer for a list of [x,y,z]: an (N,3) float64 array, or
+# (without NumPy) a list of float lists
 
-    glClearColor( 1,1,1,0 )
-    glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT );
-    glEnable( GL_DEPTH_TEST )
-    glPolygonMode( GL_FRONT_AND_BACK, GL_FILL )
+def makeCoords( points ):
 
-    # Apply zoom to fovy
+    if np is not None:
+        return np.array( points, dtype=np.float64 ).reshape( -1, 3 )
+    else:
+        return [ [ float(x) for x in p ] for p in points ]
 
-    glMatrixMode( GL_PROJECTION )
-    glLoadIdentity()
 
-    if fovyDelta is not None:
-        zoomedFovy = fovy + fovyDelta
-    else:
-        zoomedFovy = fovy
 
-    gluPerspective( zoomedFovy, float(windowWidth) / float(windowHeight), fNear, fFar );
+# Contour simplification
+#
+# Tiling cost grows with the product of the two slices' vertex counts,
+# so contours with many nearly collinear points can be thinned first
+# (see Slice.decimated() and Slice.resampled()) at the cost of a
+# bounded change in shape.  These work on a slice's coordinate buffer
+# and treat it as a closed contour.
 
-    # Apply rotation to eye position
 
-    if rotationAngle is None:
-        rotatedEye = eye
-        rotatedUp  = updir
-    else:
-        rotatedEye = rotateVector( eye,   rotationAngle, rotationAxis )
-        rotatedUp  = rotateVector( updir, rotationAngle, rotationAxis )
+# Indices of the points of a closed contour to keep so that no dropped
+# point is further than 'tolerance' from the simplified contour
+# (Douglas-Peucker).  The contour is split at point 0 and the point
+# furthest from it, and each half simplified.  At least 3 points are
+# kept.
+
+def decimateContour( coords, tolerance ):
+
+    pts = asPointList( coords ) if np is None else np.asarray( coords, dtype=np.float64 ).reshape( -1, 3 )
+    n   = len(pts)
+
+    if n <= 3:
+        return list( range(n) )
+
+    far  = int( argmax( pointDistances( pts, pts[0] ) ) )
+    keep = set( [ 0, far ] )
+
+    # ( a, b ) is a run of the contour from point a to point b (b may be n, meaning point 0)
+
+    runs = [ (0, far), (far, n) ]
+
+    while runs:
+
+        a, b = runs.pop()
+        if b - a < 2:
+            continue
+
+        dists = segmentDistances( pts[a+1:b], pts[a], pts[b % n] )
+        i     = int( argmax( dists ) )
+
+        if dists[i] > tolerance:
+            keep.add( a+1+i )
+            runs.append( (a, a+1+i) )
+            runs.append( (a+1+i, b) )
+
+    if len(keep) < 3: # keep the point furthest from the line through the other two
+        dists = segmentDistances( pts, pts[0], pts[far] )
+        keep.add( int( argmax( dists ) ) )
+
+    return sorted( keep )
+
+
+# 'count' points evenly spaced by arc length around a closed contour,
+# starting at its first point
+
+def resampleContour( coords, count ):
+
+    if np is not None:
+
+        pts     = np.asarray( coords, dtype=np.float64 ).reshape( -1, 3 )
+        closed  = np.concatenate( [ pts, pts[:1] ] )
+        arc     = np.concatenate( [ [0.0], np.cumsum( lengths( closed[1:] - closed[:-1] ) ) ] )
+        targets = np.arange( count ) * (arc[-1] / count)
+
+        return np.stack( [ np.interp( targets, arc, closed[:,k] ) for k in range(3) ], axis=-1 )
+
+    pts    = asPointList( coords )
+    closed = pts + pts[:1]
+    total  = contourLength( pts )
+    result = []
+
+    seg      = 0   # current segment closed[seg] -> closed[seg+1]
+    segStart = 0.0 # arc length at closed[seg]
+
+    for j in range(count):
+
+        target = j * total / count
+        segLength = length( subtract( closed[seg+1], closed[seg] ) )
 
-    glMatrixMode( GL_MODELVIEW )
-    glLoadIdentity()
+        while segStart + segLength < target and seg < len(closed) - 2:
+            segStart += segLength
+            seg      += 1
+            segLength = length( subtract( closed[seg+1], closed[seg] ) )
 
-    gluLookAt( rotatedEye[0], rotatedEye[1], rotatedEye[2],
-	       lookat[0],     lookat[1],     lookat[2],
-	       rotatedUp[0],  rotatedUp[1],  rotatedUp[2] );
+        t = (target - segStart) / segLength if segLength > 0 else 0.0
+        result.append( add( closed[seg], scalarMult( t, subtract( closed[seg+1], closed[seg] ) ) ) )
 
-    # Draw slices
+    return result
 
-    if showCurrentSlice:
-        slicesToDraw = [ allSlices[currentSlice], allSlices[currentSlice+1] ]
+
+# Distance from each point to point p, and to the segment a-b
+
+def pointDistances( pts, p ):
+
+    return lengths( subtracts( pts, p ) )
+
+
+def segmentDistances( pts, a, b ):
+
+    if np is not None:
+        ab    = b - a
+        ab2   = dotProducts( ab, ab )
+        t     = np.clip( dotProducts( pts - a, ab ) / ab2, 0.0, 1.0 ) if ab2 > 0 else np.zeros( len(pts) )
+        return lengths( pts - (a + t[:,None] * ab) )
+
+    ab  = subtract( b, a )
+    ab2 = dotProduct( ab, ab )
+    dists = []
+    for q in pts:
+        t = min( 1.0, max( 0.0, dotProduct( subtract( q, a ), ab ) / ab2 ) ) if ab2 > 0 else 0.0
+        dists.append( length( subtract( q, add( a, scalarMult( t, ab ) ) ) ) )
+    return dists
+
+
+def argmax( values ):
+
+    if np is not None:
+        return np.argmax( values )
     else:
-        slicesToDraw = allSlices
+        return max( range(len(values)), key=values.__getitem__ )
+
+
+# Slices simplified as the mesh command's options ask, lazily
 
-    if allTriangles == []:
-        for slice in slicesToDraw:
-            slice.draw() # draws the EDGES of each slice
+def simplifySlices( slices, tolerance=None, count=None, spacing=None ):
 
-    # Set up lighting for triangles
+    for slice in slices:
+        if tolerance is not None:
+            slice = slice.decimated( tolerance )
+        if count is not None or spacing is not None:
+            slice = slice.resampled( count, spacing )
+        yield slice
 
-    lightDir = add( scalarMult( 5, normalize( rotatedEye ) ), # light is above and right of viewer
-                    add( normalize( rotatedUp ), 
-                         normalize( crossProduct( rotatedUp, rotatedEye ) ) ) )
 
-    glLightfv( GL_LIGHT0, GL_POSITION, lightDir + [0.0] )
+# A coarser stack of layers (lists of contours, as from groupLayers()),
+# for drawing at a distance: every 'step'-th layer, always with the
+# first and last, and each contour decimated to 'tolerance'
 
-    glLightfv( GL_LIGHT0, GL_AMBIENT,  [ 0.2, 0.2, 0.2, 0.0 ] )
-    glLightfv( GL_LIGHT0, GL_DIFFUSE,  [ 1.0, 1.0, 1.0, 0.0 ] )
-    glLightfv( GL_LIGHT0, GL_SPECULAR, [ 1.0, 1.0, 1.0, 0.0 ] )
+def coarseLayers( layers, step, tolerance ):
 
-    glEnable( GL_LIGHT0 )
+    picked = list( layers[::step] )
+    if (len(layers) - 1) % step:
+        picked.append( layers[-1] )
 
-    glLightModeli( GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE )
+    return [ [ contour.decimated( tolerance ) for contour in layer ] for layer in picked ]
+
+
+
+# Triangle
 
-    # Draw triangles
+class Triangle(object):
 
-    glEnable( GL_LIGHTING )
+    nextID = 0
     
-    glBegin( GL_TRIANGLES )
-    for tri in allTriangles:
-        glNormal3fv( tri.norm )
-        glVertex3fv( tri.verts[0].coords )
-        glVertex3fv( tri.verts[1].coords )
-        glVertex3fv( tri.verts[2].coords )
-    glEnd()
+    def __init__( self, verts, norm=None ):
 
-    glDisable( GL_LIGHTING )
+        self.verts  = verts # [ v0, v1, v2 ] is CCW order as seen from outside the object
+        self.normal = norm  # outward-pointing unit normal, if already known (see Mesh.faceNormals())
 
-    # Draw axes (x=red, y=green, z=blue)
+        self.id     = Triangle.nextID
+        Triangle.nextID += 1
 
-    glLineWidth( 3.0 )
-    glBegin( GL_LINES )
+    def __repr__( self ):
+        return 't%d' % self.id
 
-    l = 10 # axis length
+    # Outward-pointing unit normal, computed on first use
 
-    glColor3fv( [1,0,0] )  # x
-    glVertex3fv( [0,0,0] )
-    glVertex3fv( [l,0,0] )
+    @property
+    def norm( self ):
 
-    glColor3fv( [0,1,0] )  # y
-    glVertex3fv( [0,0,0] )
-    glVertex3fv( [0,l,0] )
+        if self.normal is None:
+            verts = self.verts
+            self.normal = normalize( crossProduct( subtract( verts[1].coords, verts[0].coords ),
+                                                   subtract( verts[2].coords, verts[0].coords ) ) )
+        return self.normal
 
-    glColor3fv( [0,0,1] )  # z
-    glVertex3fv( [0,0,0] )
-    glVertex3fv( [0,0,l] )
+# Backtrack direction for each cell of the DP table.  An IntEnum so
+# that the NumPy backend can keep directions in a uint8 array.
 
-    glEnd()
-    glLineWidth( 1.0 )
+class Dir(enum.IntEnum):
+    PREV_ROW = 1
+    PREV_COL = 2
 
-    # Draw labels
 
-    glDisable( GL_DEPTH_TEST )
+def buildTriangles( slice0, slice1, backend=None, optimal=False, cost='area', band=None, cache=None ):
 
-    if labelVerts:
-        glColor3f(0,0,0)
-        for slice in slicesToDraw:
-            for vert in slice.verts:
-                drawText( vert.coords, repr(vert) )
-    
-    if labelEdges:
-        glColor3f(0,0,0)
-        for slice in slicesToDraw:
-            for vert in slice.verts:
-                drawText( scalarMult( 0.5, add( vert.coords, vert.nextV.coords ) ), ('%s-%s' % (repr(vert),repr(vert.nextV))) )
-    
-    if labelTris:
-        glColor3f(0,0,0)
-        for tri in allTriangles:
-            drawText( scalarMult( 0.3333, add( tri.verts[0].coords, add( tri.verts[1].coords, tri.verts[2].coords ) ) ), repr(tri) )
-    
-    # Show window
+    tris = next( iterTriangles( [ (slice0, slice1) ], backend, 1, optimal, cost, band, cache ) )[2]
 
-    glfw.swap_buffers( window )
+    mesh = Mesh( [ slice0, slice1 ] )
+    mesh.addPair( 0, tris )
 
-    
+    return mesh.triangles()
 
-def drawText( coords, text ):
 
-    if haveGlutForFonts:
-        glRasterPos3fv( coords )
-        for ch in text:
-            glutBitmapCharacter( GLUT_BITMAP_8_BY_13, ord(ch) )
+# Triangulate between two contours given only their coordinates
+#
+# Returns (i,j,k) index triples into coords0 + coords1, i.e. an index
+# below len(coords0) is a point of the first contour and the rest are
+# points of the second.  Working on plain coordinates (rather than
+# Vertex objects) lets this run in a worker process.
+#
+# 'cost' names the per-triangle cost that is minimized (a key of
+# 'costFunctions').  With optimal=True the tiling is the minimum-cost
+# one over all starting edges (see tileOptimal()) instead of the one
+# that starts at the closest pair of vertices.  With a 'band' width,
+# only cells near the diagonal of the table are filled (see
+# fillTableBanded()); this is ignored if optimal=True.  'start' is
+# the (i0,i1) pair of indices to start the tiling from; by default it
+# is the closest pair of vertices.
 
+def tilePair( coords0, coords1, backend=None, optimal=False, cost='area', band=None, start=None ):
 
+    pts0 = asPointList( coords0 )
+    pts1 = asPointList( coords1 )
 
-# Handle keyboard input
+    if cost not in costFunctions:
+        raise ValueError( 'unknown cost %r (choose from %s)' % (cost, ', '.join(sorted(costFunctions))) )
 
-def keyCallback( window, key, scancode, action, mods ):
+    frame = pairFrame( coords0, coords1 )
 
-    global currentSlice, showCurrentSlice, allTriangles, labelVerts, labelEdges, labelTris
-    
-    if action == glfw.PRESS:
-    
-        if key == glfw.KEY_ESCAPE: # quit upon ESC
-            sys.exit(0)
+    counted( 'pairs tiled' )
 
-        elif key == ord('C'): # compute min-area triangulation
+    if optimal:
+        with timed( 'optimal tiling' ):
+            return tileOptimal( pts0, pts1, backend, cost, frame )
 
-            if showCurrentSlice:
-                allTriangles = buildTriangles( allSlices[currentSlice], allSlices[currentSlice+1] )
-            else:
-                allTriangles = []
-                for i in range(len(allSlices)-1):
-                    sys.stdout.write( '\r%d left ' % (len(allSlices)-1-i) )
-                    sys.stdout.flush();
-                    allTriangles += buildTriangles( allSlices[i], allSlices[i+1] )
-                sys.stdout.write( '\r          \n' )
-            
-        elif key == ord('S'): # show current slice
-            showCurrentSlice = not showCurrentSlice
+    n0 = len(pts0)
 
-        elif key == ord(','): # current slice moves up
-            if currentSlice > 0:
-                currentSlice -= 1
-            
-        elif key == ord('.'): # current slice moves down
-            if currentSlice < len(allSlices)-2:
-                currentSlice += 1
+    # Find the closest pair of vertices (one from each slice) to start with.
 
-        elif key == ord('V'): # toggle vertex labels
-            labelVerts = not labelVerts
+    if start is None:
+        with timed( 'seed' ):
+            start = findClosestVertices( pts0, pts1 )
 
-        elif key == ord('E'): # toggle edge labels
-            labelEdges = not labelEdges
+    start0, start1 = start
 
-        elif key == ord('T'): # toggle triangle labels
-            labelTris = not labelTris
+    # Rotate both contours to start there, and close them by repeating
+    # the start point at the end.  'order0' and 'order1' map a table
+    # column/row to the index of its point.
 
-        elif key == ord('/'):
+    order0 = [ (start0 + c) % len(pts0) for c in range(len(pts0)+1) ]
+    order1 = [ (start1 + r) % len(pts1) for r in range(len(pts1)+1) ]
 
-            print( 'keys: c - compute min-area triangulation' )
-            print( '      s - toggle current slice' )
-            print( '      < - current slice moves up' )
-            print( '      > - current slice moves down' )
-            print( '      v - toggle vertex labels' )
-            print( '      e - toggle edge labels' )
-            print( '      t - toggle triangle labels' )
-            print( '' )
-            print( 'mouse: drag left button          - rotate' )
-            print( '       drag right button up/down - zoom' )
+    # Fill the 'minDir' table.  Row r is pts1[order1[r]] and column c
+    # is pts0[order0[c]]; each cell records which neighbour its path
+    # came from.
 
+    if backend is None:
+        backend = defaultBackend()
 
+    if backend not in fillBackends:
+        raise ValueError( 'unknown backend %r (choose from %s)' % (backend, ', '.join(sorted(fillBackends))) )
 
-# Handle window reshape
+    verts0 = [ pts0[i] for i in order0 ]
+    verts1 = [ pts1[i] for i in order1 ]
 
-def windowReshapeCallback( window, newWidth, newHeight ):
+    with timed( 'fill' ):
+        if band is not None:
+            minDir = fillTableBanded( verts0, verts1, cost, frame, band, backend.startswith( 'numpy' ) )
+        else:
+            minDir = fillBackends[backend]( verts0, verts1, cost, frame )
+            counted( 'cells filled', len(verts0) * len(verts1) )
 
-    global windowWidth, windowHeight
+    # Walk backward through the 'minDir' array to build triangulation.
 
-    windowWidth  = newWidth
-    windowHeight = newHeight
+    triangles = []
+    r, c = len(order1) - 1, len(order0) - 1
 
+    # iterate backwards through array and append triangles
+    with timed( 'backtrack' ):
+        while r > 0 or c > 0:
+            if minDir[r][c] == Dir.PREV_ROW:
+                triangles.append( (n0 + order1[r-1], n0 + order1[r], order0[c]) )
+                r -= 1
+            elif minDir[r][c] == Dir.PREV_COL:
+                triangles.append( (n0 + order1[r], order0[c-1], order0[c]) )
+                c -= 1
 
+    return triangles
 
-# Handle mouse click/release
 
-initX  = 0
-initY  = 0
-button = None
+# Minimum-cost tiling over all starting edges
+#
+# Every tiling uses some edge from pts0[0] to a point of pts1, so it is
+# enough to try each pts1[k] as the partner of pts0[0].  Rows of the
+# table are pts1 repeated twice (row r is pts1[r % n1]) and column c is
+# pts0[c % n0]; the tiling that starts at pts1[k] is a shortest path
+# from (k,0) to (k+n1,n0).
+#
+# Rather than solving all n1 problems from scratch (O(n1*n1*n0)), this
+# uses the divide-and-conquer of Fuchs, Kedem and Uselton: the shortest
+# paths for different k need never cross, so once the paths for i and
+# j are known, the path for k=(i+j)/2 can be searched for only in the
+# region between them.  Each level of the recursion then covers the
+# table about once, for O(n0*n1*log n1) overall.
 
-def mouseButtonCallback( window, btn, action, keyModifiers ):
+def tileOptimal( pts0, pts1, backend=None, cost='area', frame=None ):
 
-    global button, initX, initY, eye, updir, fovy, rotationAngle, rotationAxis, fovyDelta
+    n0 = len(pts0)
+    n1 = len(pts1)
 
-    if action == glfw.PRESS:
+    if backend is None:
+        backend = defaultBackend()
 
-        button = btn
-        initX, initY = glfw.get_cursor_pos( window ) # store mouse position
+    if backend not in fillBackends:
+        raise ValueError( 'unknown backend %r (choose from %s)' % (backend, ', '.join(sorted(fillBackends))) )
 
-        rotationAngle = 0
-        rotationAxis  = [1,0,0]
+    if frame is None:
+        frame = pairFrame( pts0, pts1 )
 
-    elif action == glfw.RELEASE:
+    # rowCost[r][c] = cost of ( pts1[r-1], pts1[r], pts0[c] ), r in 1..2*n1
+    # colCost[r][c] = cost of ( pts1[r], pts0[c], pts0[c-1] ), c in 1..n0
 
-        if rotationAngle is not None:
-            eye   = rotateVector( eye, rotationAngle, rotationAxis )
-            updir = rotateVector( updir, rotationAngle, rotationAxis )
+    rows = [ pts1[r % n1] for r in range(2*n1+1) ]
+    cols = [ pts0[c % n0] for c in range(n0+1) ]
 
-        if fovyDelta is not None:
-            fovy = fovy + fovyDelta
+    if backend.startswith( 'numpy' ):
+        rowCost, colCost = stepCosts( cols, rows, cost, frame )
+        rowCost = rowCost.tolist()
+        colCost = colCost.tolist()
+    else:
+        costFn  = costFunctions[cost][0]
+        rowCost = [ [0] + [0] * n0 ] + [ [ costFn( rows[r-1], rows[r], cols[c], frame ) for c in range(n0+1) ]
+                                         for r in range(1, 2*n1+1) ]
+        colCost = [ [0] + [ costFn( rows[r], cols[c], cols[c-1], frame ) for c in range(1, n0+1) ]
+                    for r in range(2*n1+1) ]
 
-        button        = None
-        rotationAngle = None
-        fovyDelta     = None
+    # Shortest path from (k,0) to (k+n1,n0) that stays within rows
+    # lo[c]..hi[c] of each column c.  Returns its cost and its cells.
 
-    
+    def shortestPath( k, lo, hi ):
 
-# Handle mouse motion.  We don't want to transform the image and
-# redraw with each tiny mouse movement.  Instead, just record the fact
-# that the mouse moved.  After events are processed in
-# glfw.wait_events(), check whether the mouse moved and, if so, act on
-# it.
+        inf = float('inf')
 
+        # column 0 can only be walked down from (k,0)
 
-mousePositionChanged = False
+        total = [ inf ] * (hi[0]-lo[0]+1)
+        dirs = [ [ Dir.PREV_ROW ] * len(total) ]
+        total[k-lo[0]] = 0
+        for r in range( k+1, hi[0]+1 ):
+            total[r-lo[0]] = total[r-1-lo[0]] + rowCost[r][0]
 
-def mouseMovementCallback( window, x, y ):
+        for c in range( 1, n0+1 ):
 
-  global mousePositionChanged
+            prevTotal, prevLo, prevHi = total, lo[c-1], hi[c-1]
 
-  if button is not None: # button is held down
-      mousePositionChanged = True
+            total = [ inf ] * (hi[c]-lo[c]+1)
+            dirs.append( [ Dir.PREV_COL ] * len(total) )
+            colDirs = dirs[c]
 
+            for r in range( lo[c], hi[c]+1 ):
 
+                if prevLo <= r <= prevHi:
+                    best = prevTotal[r-prevLo] + colCost[r][c]
+                else:
+                    best = inf
 
-def actOnMouseMovement( window, button, x, y ):
+                if r > lo[c]:
+                    fromRow = total[r-1-lo[c]] + rowCost[r][c]
+                    if fromRow < best:
+                        best = fromRow
+                        colDirs[r-lo[c]] = Dir.PREV_ROW
 
-    global currentImage, rotationAngle, rotationAxis, fovyDelta
+                total[r-lo[c]] = best
 
-    if button == glfw.MOUSE_BUTTON_LEFT:
+        # walk back from the end
 
-        # rotate viewpoint
+        r, c = k+n1, n0
+        cells = [ (r,c) ]
+        while r > k or c > 0:
+            if dirs[c][r-lo[c]] == Dir.PREV_ROW:
+                r -= 1
+            else:
+                c -= 1
+            cells.append( (r,c) )
 
-        # Get initial vector from (0,0,0) to mouse
-      
-        x0 =   (initX - float(windowWidth)/2.0)  / (float(windowWidth)/2.0)
-        y0 = - (initY - float(windowHeight)/2.0) / (float(windowHeight)/2.0)
+        return total[k+n1-lo[n0]], cells
 
-        dSquared = x0*x0 + y0*y0
-        if dSquared > 1:
-            d = math.sqrt(dSquared)
-            x0 /= d
-            y0 /= d
-            dSquared = 1
+    # First and last row of a path in each column
 
-        z0 = math.sqrt( 1 - dSquared )
+    def pathBounds( cells, shift=0 ):
 
-        # Get current vector from (0,0,0) to mouse
-        
-        x1 =   (x - float(windowWidth)/2.0)  / (float(windowWidth)/2.0)
-        y1 = - (y - float(windowHeight)/2.0) / (float(windowHeight)/2.0)
+        first = [ None ] * (n0+1)
+        last  = [ None ] * (n0+1)
+        for r, c in cells:
+            r += shift
+            if first[c] is None or r < first[c]:
+                first[c] = r
+            if last[c] is None or r > last[c]:
+                last[c] = r
+        return first, last
 
-        dSquared = x1*x1 + y1*y1
-        if dSquared > 1:
-            d = math.sqrt(dSquared)
-            x1 /= d
-            y1 /= d
-            dSquared = 1
+    # The path for k=0 is unconstrained.  The path for k=n1 is the same
+    # path shifted down by n1 rows.
 
-        z1 = math.sqrt( 1 - dSquared )
+    total, cells = shortestPath( 0, [0] * (n0+1), [n1] * (n0+1) )
+    best = [ total, cells ]
 
-        # Find rotation angle and axis (in coordinate system aligned with window x and y)
+    bounds = { 0:  pathBounds( cells ),
+               n1: pathBounds( cells, n1 ) }
 
-        angleCos = x0*x1 + y0*y1 + z0*z1
+    # Divide and conquer between pairs of known paths.
 
-        if angleCos > 1:
-            angleCos = 1
-        elif angleCos < -1:
-            angleCos = -1
+    stack = [ (0, n1) ]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        k = (i+j) // 2
+        total, cells = shortestPath( k, bounds[i][0], bounds[j][1] )
+        if total < best[0]:
+            best = [ total, cells ]
+        bounds[k] = pathBounds( cells )
+        stack.append( (i,k) )
+        stack.append( (k,j) )
 
-        rotationAngle = math.acos( angleCos )
+    # Turn the best path into triangles, walking it from the end as
+    # tilePair() does.
 
-        if abs(rotationAngle) < 0.0001:
-            rotationAngle = 0
-            rotationAxis = [ 1,0,0 ]
+    triangles = []
+    cells = best[1]
+    for (r,c), (prevR,prevC) in zip( cells, cells[1:] ):
+        if prevR < r:
+            triangles.append( (n0 + (r-1) % n1, n0 + r % n1, c % n0) )
         else:
-            rotationAxis = crossProduct( [x0,y0,z0], [x1,y1,z1] )
-            d = math.sqrt( rotationAxis[0]*rotationAxis[0] + rotationAxis[1]*rotationAxis[1] + rotationAxis[2]*rotationAxis[2] )
-            rotationAxis = [ rotationAxis[0]/d, rotationAxis[1]/d, rotationAxis[2]/d ]
+            triangles.append( (n0 + r % n1, (c-1) % n0, c % n0) )
 
-        # Move rotation axis into world coordinate system
+    return triangles
 
-        eyeZ = normalize( [ eye[0]-lookat[0], eye[1]-lookat[1], eye[2]-lookat[2] ] )
-        eyeX = normalize( crossProduct( eyeZ, updir ) )
-        eyeY = normalize( crossProduct( eyeZ, eyeX ) )
 
-        rotationAxis = [ rotationAxis[0] * eyeX[0] + rotationAxis[1] * eyeY[0] + rotationAxis[2] * eyeZ[0],
-                         rotationAxis[0] * eyeX[1] + rotationAxis[1] * eyeY[1] + rotationAxis[2] * eyeZ[1],
-                         rotationAxis[0] * eyeX[2] + rotationAxis[1] * eyeY[2] + rotationAxis[2] * eyeZ[2] ]
+# Find the closest pair of points (one from each contour).  Returns
+# their indices.  'tree1' is a KDTree over pts1, which is built here
+# if not given (and then pts1 is not needed).
+#
+# Each point of pts0 is looked up in the tree, bounded by the best
+# squared distance so far, so most lookups stop at the first node.
 
-    elif button == glfw.MOUSE_BUTTON_RIGHT:
+def findClosestVertices( pts0, pts1, tree1=None ):
 
-        # zoom viewpoint
+    if tree1 is None:
+        tree1 = KDTree( pts1 )
 
-        fovyDelta = (initY - y) / float(windowHeight) * fovy
+    minDist2 = float('inf')
+    closest  = None
 
+    for i0, p in enumerate( pts0 ):
+        d2, i1 = tree1.nearest( p, minDist2 )
+        if i1 is not None:
+            minDist2 = d2
+            closest  = (i0, i1)
+            if minDist2 == 0:
+                break
 
+    return closest
 
-# Some vector functions (to avoid having to install NumPy)
 
+# Starting pair for tiling slice0 to slice1, using slice1's index
 
-def add( v0, v1 ):
+def seedPair( slice0, slice1 ):
 
-    return [ v0[0]+v1[0], v0[1]+v1[1], v0[2]+v1[2] ]
+    with timed( 'seed' ):
+        return findClosestVertices( asPointList( slice0.coords ), None, slice1.spatialIndex() )
 
 
-def subtract( v0, v1 ):
+# KD-tree over a list of [x,y,z] points
+#
+# Nodes are kept in parallel lists.  An inner node splits on 'axis' at
+# 'split' (points with coordinate < split are on the 'below' side); a
+# leaf holds up to 'leafSize' point indices.  Built in O(N log N);
+# nearest-neighbour queries take O(log N) on well-spread points.
 
-    return [ v0[0]-v1[0], v0[1]-v1[1], v0[2]-v1[2] ]
+class KDTree(object):
 
+    def __init__( self, pts, leafSize=8 ):
 
-def scalarMult( k, v ):
+        self.pts      = pts
+        self.leafSize = leafSize
 
-    return [ k*v[0], k*v[1], k*v[2] ]
+        self.axis   = [] # -1 for a leaf
+        self.split  = []
+        self.below  = [] # child node numbers
+        self.above  = []
+        self.leaf   = [] # point indices, or None for an inner node
 
-              
-def dotProduct( v0, v1 ):
+        if len(pts) > 0:
+            self.build( list(range(len(pts))) )
 
-    return v0[0]*v1[0] + v0[1]*v1[1] + v0[2]*v1[2]
+    def build( self, indices ):
 
+        node = len(self.axis)
+        self.axis.append( -1 )
+        self.split.append( 0 )
+        self.below.append( -1 )
+        self.above.append( -1 )
+        self.leaf.append( indices )
 
-def crossProduct( v0, v1 ):
+        if len(indices) <= self.leafSize:
+            return node
 
-    return [ v0[1]*v1[2] - v0[2]*v1[1], v0[2]*v1[0] - v0[0]*v1[2], v0[0]*v1[1] - v0[1]*v1[0] ]
+        # split the longest side of the bounding box at the median
 
+        pts    = self.pts
+        extent = [ max( pts[i][a] for i in indices ) - min( pts[i][a] for i in indices ) for a in range(3) ]
+        axis   = extent.index( max( extent ) )
 
-def length( v ):
+        if extent[axis] == 0: # all points coincide
+            return node
 
-    return math.sqrt( v[0]*v[0] + v[1]*v[1] + v[2]*v[2] )
+        indices.sort( key=lambda i: pts[i][axis] )
+        mid = len(indices) // 2
+        while mid > 0 and pts[indices[mid-1]][axis] == pts[indices[mid]][axis]:
+            mid -= 1 # keep equal coordinates on one side
+        if mid == 0:
+            mid = len(indices) // 2
+            while pts[indices[mid]][axis] == pts[indices[0]][axis]:
+                mid += 1
 
+        self.axis[node]  = axis
+        self.split[node] = pts[indices[mid]][axis]
+        self.leaf[node]  = None
 
-def normalize( v ):
+        self.below[node] = self.build( indices[:mid] )
+        self.above[node] = self.build( indices[mid:] )
 
-    d = length( v )
+        return node
 
-    if d > 0.0001:
-        return [ v[0]/d, v[1]/d, v[2]/d ]
-    else:
-        return v
+    # Nearest point to p that is closer than sqrt(maxDist2).  Returns
+    # (squared distance, index), or (maxDist2, None) if there is none.
+    # Of equally near points, the one found first is returned.
 
+    def nearest( self, p, maxDist2=float('inf') ):
 
-def triangleArea( v0, v1, v2 ):
+        best  = maxDist2
+        found = None
 
-    return 0.5 * length( crossProduct( subtract( v1, v0 ), subtract( v2, v0 ) ) )
+        if not self.axis:
+            return best, found
 
+        pts   = self.pts
+        stack = [ (0, 0.0) ] # node and squared distance to its region (lower bound)
 
-def rotateVector( v, angle, axis ): # rotate v by angle about axis (axis must be unit length)
+        while stack:
 
-    cosAngle = math.cos(angle)
-    sinAngle = math.sin(angle)
+            node, bound = stack.pop()
+            if bound >= best:
+                continue
 
-    cross = crossProduct( axis, v )
-    dot   = dotProduct( axis, v ) * (1 - cosAngle)
+            while self.leaf[node] is None:
+                axis = self.axis[node]
+                d    = p[axis] - self.split[node]
+                if d < 0:
+                    near, far = self.below[node], self.above[node]
+                else:
+                    near, far = self.above[node], self.below[node]
+                if d*d < best:
+                    stack.append( (far, d*d) )
+                node = near
 
+            for i in self.leaf[node]:
+                q  = pts[i]
+                dx = p[0]-q[0]
+                dy = p[1]-q[1]
+                dz = p[2]-q[2]
+                d2 = dx*dx + dy*dy + dz*dz
+                if d2 < best:
+                    best  = d2
+                    found = i
 
-    return [ v[0] * cosAngle + cross[0] * sinAngle + axis[0] * dot,
-             v[1] * cosAngle + cross[1] * sinAngle + axis[1] * dot,
-             v[2] * cosAngle + cross[2] * sinAngle + axis[2] * dot ]
+        return best, found
 
+    # Indices of all points within sqrt(maxDist2) of p
 
+    def within( self, p, maxDist2 ):
 
-# Read slices from a file
-# Each 'pointA-B' above is 'x y z' separated by spaces.
+        found = []
 
-def readSlices( f ):
+        if not self.axis:
+            return found
 
-    lines = f.readlines()
+        pts   = self.pts
+        stack = [ 0 ]
 
-    numSlices = int(lines[0])
-    slices = []
-    lineNum = 1
+        while stack:
 
-    for i in range(numSlices):
+            node = stack.pop()
 
-        numPoints = int(lines[lineNum])
-        lineNum += 1
+            if self.leaf[node] is None:
+                d = p[self.axis[node]] - self.split[node]
+                if d < 0 or d*d <= maxDist2:
+                    stack.append( self.below[node] )
+                if d >= 0 or d*d <= maxDist2:
+                    stack.append( self.above[node] )
+                continue
 
-        slice = Slice( [ Vertex( [ float(n) for n in line.split() ] )
-                         for line in lines[lineNum:lineNum+numPoints] ] )
+            for i in self.leaf[node]:
+                q  = pts[i]
+                dx = p[0]-q[0]
+                dy = p[1]-q[1]
+                dz = p[2]-q[2]
+                if dx*dx + dy*dy + dz*dz <= maxDist2:
+                    found.append( i )
 
-        for v0,v1 in zip( slice.verts, slice.verts[1:] + [slice.verts[0]] ):
-            v0.nextV = v1
+        return found
 
-        slices.append( slice )
-        lineNum += numPoints
 
-    slices.reverse() # so that first slice is on top
+# Coordinates of a slice in the compact form that tilePair() takes and
+# that is cheap to send to a worker process.  This is the slice's own
+# buffer (see Slice), not a copy.
 
-    return slices
+def sliceCoords( slice ):
 
+    return slice.coords
 
-    
-# Initialize GLFW and run the main event loop
 
-def main():
+def asPointList( coords ):
+
+    if np is not None and isinstance( coords, np.ndarray ):
+        return coords.tolist()
+    else:
+        return coords
+
+
+# DP table fill, pure Python
+#
+# 'verts0' and 'verts1' are the closed, rotated contours as lists of
+# [x,y,z].  minCost[r][c] is the least total cost of tiling verts1[:r+1]
+# against verts0[:c+1], reached either from (r-1,c) by adding the
+# triangle ( verts1[r-1], verts1[r], verts0[c] ) or from (r,c-1) by
+# adding ( verts1[r], verts0[c-1], verts0[c] ).  Ties go to PREV_COL.
+# The column step's triangle is costed as ( verts1[r], verts0[c],
+# verts0[c-1] ), wound the same way round as the row step's, which
+# matters to the 'volume' cost (see Triangle cost functions).
+#
+# This is the reference implementation; the other backends must
+# produce the same table.
+
+def fillTablePython( verts0, verts1, cost='area', frame=None ):
+
+    costFn = costFunctions[cost][0]
 
-    global window, allSlices, mousePositionChanged
+    minCost = [[0] * len(verts0) for _ in range(len(verts1))]
+    minDir  = [[None] * len(verts0) for _ in range(len(verts1))]
+
+
+    minCost[0][0] = 0  # Starting edge has zero cost
+
+    for c in range(1, len(verts0)):
+        minCost[0][c] = minCost[0][c - 1] + costFn(verts1[0], verts0[c], verts0[c - 1], frame)
+        minDir[0][c] = Dir.PREV_COL
     
-    # Check command-line args
+    for r in range(1, len(verts1)):
+        minCost[r][0] = minCost[r - 1][0] + costFn(verts1[r - 1], verts1[r], verts0[0], frame)
+        minDir[r][0] = Dir.PREV_ROW
 
-    if len(sys.argv) < 2:
-        print( 'Usage: %s filename' % sys.argv[0] )
-        sys.exit(1)
+    for r in range(1, len(verts1)):
+        for c in range(1, len(verts0)):
+            cost_from_row = minCost[r - 1][c] + costFn(verts1[r - 1], verts1[r], verts0[c], frame)
+            cost_from_col = minCost[r][c - 1] + costFn(verts1[r], verts0[c], verts0[c - 1], frame)
+            if cost_from_row < cost_from_col:
+                minCost[r][c] = cost_from_row
+                minDir[r][c] = Dir.PREV_ROW
+            else:
+                minCost[r][c] = cost_from_col
+                minDir[r][c] = Dir.PREV_COL
 
-    args = sys.argv[1:]
-    while len(args) > 1:
-        # if args[0] == '-x':
-        #     pass
-        args = args[1:]
+    # Debugging
 
-    # Set up window
-  
-    if not glfw.init():
-        print( 'Error: GLFW failed to initialize' )
-        sys.exit(1)
+    # print minDir and minCost arrays in readable format
+    # print("               ", end="")
+    # for c in range(len(verts0)):
+    #     print(f"  {c:4}", end="")
+    # print()
+    # for r in range(len(verts1)):
+    #     print(f"{r:4}", end="   ")
+    #     for c in range(len(verts0)):
+    #         print(f"{minCost[r][c]:6.0f}", end=" ")
+    #         if minDir[r][c] == Dir.PREV_ROW:
+    #             print("|", end=" ")
+    #         elif minDir[r][c] == Dir.PREV_COL:
+    #             print("-", end=" ")
+    #         else:
+    #             print(" ", end=" ")
+    #     print()
 
-    if haveGlutForFonts:
-        glutInit()
+    return minDir
 
-    window = glfw.create_window( windowWidth, windowHeight, "3D Meshing", None, None )
 
-    if not window:
-        glfw.terminate()
-        print( 'Error: GLFW failed to create a window' )
-        sys.exit(1)
+# DP table fill, NumPy
+#
+# All row-step and column-step triangle costs are computed up front as
+# (n+1)x(m+1) arrays in one batched pass.  The recurrence is then swept
+# one anti-diagonal at a time: every cell on diagonal r+c=k depends
+# only on diagonal k-1, so a whole diagonal is one vector operation.
+# In the flattened table a diagonal is a slice with stride m.  The
+# additions and comparisons are the same as in fillTablePython(), so
+# the tables are identical.
 
-    glfw.make_context_current( window )
-    glfw.swap_interval( 1 )
-    glfw.set_key_callback( window, keyCallback )
-    glfw.set_window_size_callback( window, windowReshapeCallback )
-    glfw.set_mouse_button_callback( window, mouseButtonCallback )
-    glfw.set_cursor_pos_callback( window, mouseMovementCallback )
+def fillTableNumPy( verts0, verts1, cost='area', frame=None ):
 
-    # Read the triangles.
+    if np is None:
+        raise ImportError( "the 'numpy' backend needs NumPy, which is not installed" )
 
-    with open( args[0], 'rb' ) as f:
-        allSlices = readSlices( f )
+    rowCost, colCost = stepCosts( verts0, verts1, cost, frame )
 
-    print( 'Read %d slices' % len(allSlices) )
+    numRows, numCols = rowCost.shape
+    m = numCols - 1
+
+    minCost = np.zeros( (numRows, numCols) )
+    minDir  = np.zeros( (numRows, numCols), dtype=np.uint8 )
+
+    minCost[0,1:] = np.cumsum( colCost[0,1:] )
+    minDir[0,1:]  = Dir.PREV_COL
+    minCost[1:,0] = np.cumsum( rowCost[1:,0] )
+    minDir[1:,0]  = Dir.PREV_ROW
+
+    costs   = minCost.reshape(-1)
+    dirs    = minDir.reshape(-1)
+    rowFlat = rowCost.reshape(-1)
+    colFlat = colCost.reshape(-1)
+
+    for k in range( 2, numRows + numCols - 1 ):
+
+        rLo = max( 1, k - m )
+        rHi = min( numRows - 1, k - 1 )
+
+        cells = slice( rLo*m + k,       rHi*m + k + 1, m ) # (r,c)
+        up    = slice( (rLo-1)*m + k-1, (rHi-1)*m + k, m ) # (r-1,c)
+        left  = slice( rLo*m + k-1,     rHi*m + k,     m ) # (r,c-1)
+
+        costFromRow = costs[up]   + rowFlat[cells]
+        costFromCol = costs[left] + colFlat[cells]
+        fromRow     = costFromRow < costFromCol
+
+        costs[cells] = np.where( fromRow, costFromRow, costFromCol )
+        dirs[cells]  = np.where( fromRow, Dir.PREV_ROW, Dir.PREV_COL )
+
+    return minDir.tolist()
+
+
+# Costs of every row step and column step of the DP table, as NumPy
+# arrays of shape (len(verts1), len(verts0)):
+#
+#   rowCost[r,c] = cost of ( verts1[r-1], verts1[r], verts0[c] )   (row 0 is unused)
+#   colCost[r,c] = cost of ( verts1[r], verts0[c], verts0[c-1] )   (column 0 is unused)
+
+def stepCosts( verts0, verts1, cost='area', frame=None ):
+
+    costFn = costFunctions[cost][1]
+
+    p0 = np.array( verts0, dtype=np.float64 ) # columns
+    p1 = np.array( verts1, dtype=np.float64 ) # rows
+
+    rowCost = np.zeros( (len(p1), len(p0)) )
+    colCost = np.zeros( (len(p1), len(p0)) )
+
+    rowCost[1:,:] = costFn( p1[:-1,None,:], p1[1:,None,:], p0[None,:,:], frame )
+    colCost[:,1:] = costFn( p1[:,None,:], p0[None,1:,:], p0[None,:-1,:], frame )
+
+    return rowCost, colCost
 
-    if len(allSlices) < 2:
-        return
 
-    # Main event loop
+# Low-memory DP table fills
+#
+# The fills above keep the whole (n+1)x(m+1) table.  fillTablePython()
+# uses two lists of lists: about 8 bytes per cell for each list slot
+# plus a 24-byte float object per cost, i.e. ~40 bytes/cell.
+# fillTableNumPy() uses ~25 bytes/cell in arrays (a float64 cost, two
+# float64 step costs and a uint8 direction), plus ~8 bytes/cell for the
+# list it returns.  For contours of a few thousand points that is
+# hundreds of MB per slice pair.
+#
+# The 'packed' fills below keep only two rows (Python) or two
+# anti-diagonals (NumPy) of costs and store directions in a PackedDirs,
+# one bit per cell: (n+1)(m+1)/8 bytes plus at most one byte of padding
+# per anti-diagonal, and O(n+m) for everything else.  They do the same
+# arithmetic as the full fills, so the directions are identical.
+
+def fillTablePythonPacked( verts0, verts1, cost='area', frame=None ):
+
+    costFn = costFunctions[cost][0]
 
-    display( window )
+    numRows = len(verts1)
+    numCols = len(verts0)
 
-    while not glfw.window_should_close( window ):
+    minDir = PackedDirs( numRows, numCols )
 
-        glfw.wait_events()
+    prevCost = [0] * numCols
+    for c in range(1, numCols):
+        prevCost[c] = prevCost[c - 1] + costFn(verts1[0], verts0[c], verts0[c - 1], frame)
+
+    for r in range(1, numRows):
+
+        curCost = [0] * numCols
+        curCost[0] = prevCost[0] + costFn(verts1[r - 1], verts1[r], verts0[0], frame)
+        minDir.setPrevRow( r, 0 )
+
+        for c in range(1, numCols):
+            cost_from_row = prevCost[c] + costFn(verts1[r - 1], verts1[r], verts0[c], frame)
+            cost_from_col = curCost[c - 1] + costFn(verts1[r], verts0[c], verts0[c - 1], frame)
+            if cost_from_row < cost_from_col:
+                curCost[c] = cost_from_row
+                minDir.setPrevRow( r, c )
+            else:
+                curCost[c] = cost_from_col
 
-        if mousePositionChanged:
-          currentX, currentY = glfw.get_cursor_pos( window )
-          actOnMouseMovement( window, button, currentX, currentY )
-          mousePositionChanged = False
-          
-        display( window )
+        prevCost = curCost
 
-    glfw.destroy_window( window )
-    glfw.terminate()
+    return minDir
+
+
+def fillTableNumPyPacked( verts0, verts1, cost='area', frame=None ):
+
+    if np is None:
+        raise ImportError( "the 'numpy-packed' backend needs NumPy, which is not installed" )
+
+    costFn = costFunctions[cost][1]
+
+    p0 = np.array( verts0, dtype=np.float64 ) # columns
+    p1 = np.array( verts1, dtype=np.float64 ) # rows
+
+    n = len(p1) - 1
+    m = len(p0) - 1
+
+    minDir = PackedDirs( n+1, m+1 )
+
+    prevCost = np.zeros( 1 ) # diagonal 0 is just (0,0)
+
+    for k in range( 1, n+m+1 ):
+
+        rLo, rHi = minDir.diagonalRows( k )
+        pLo      = minDir.diagonalRows( k-1 )[0]
+
+        curCost = np.empty( rHi-rLo+1 )
+        fromRow = np.zeros( rHi-rLo+1, dtype=bool )
+
+        # cells (r,k-r) with both neighbours, for r in a..b
+
+        a = max( 1, k-m )
+        b = min( n, k-1 )
+
+        if a <= b:
+            pc    = p0[k-b:k-a+1][::-1]   # verts0[c]
+            pcm1  = p0[k-b-1:k-a][::-1]   # verts0[c-1]
+
+            costFromRow = prevCost[a-1-pLo:b-pLo]   + costFn( p1[a-1:b], p1[a:b+1], pc, frame )
+            costFromCol = prevCost[a-pLo:b-pLo+1]   + costFn( p1[a:b+1], pc, pcm1, frame )
+            interior    = costFromRow < costFromCol
+
+            curCost[a-rLo:b-rLo+1] = np.where( interior, costFromRow, costFromCol )
+            fromRow[a-rLo:b-rLo+1] = interior
+
+        # first row (0,k) and first column (k,0)
+
+        if rLo == 0:
+            curCost[0] = prevCost[0] + costFn( p1[0], p0[k], p0[k-1], frame )
+
+        if rHi == k:
+            curCost[-1] = prevCost[k-1-pLo] + costFn( p1[k-1], p1[k], p0[0], frame )
+            fromRow[-1] = True
+
+        minDir.setDiagonal( k, fromRow )
+        prevCost = curCost
+
+    return minDir
+
+
+# DP directions packed one bit per cell (1 for PREV_ROW, 0 for
+# PREV_COL).  Bits are stored by anti-diagonal, each diagonal starting
+# on a byte boundary, so that a whole diagonal can be written at once
+# with np.packbits().  minDir[r][c] reads like the list-of-lists tables.
+
+class PackedDirs(object):
+
+    def __init__( self, numRows, numCols ):
+
+        self.numRows = numRows
+        self.numCols = numCols
+
+        self.offsets = [] # first byte of each anti-diagonal
+        size = 0
+        for k in range( numRows + numCols - 1 ):
+            self.offsets.append( size )
+            rLo, rHi = self.diagonalRows( k )
+            size += (rHi - rLo + 8) // 8
+
+        self.bits = bytearray( size )
+
+    # rows of the cells (r,k-r) on anti-diagonal k
+
+    def diagonalRows( self, k ):
+
+        return max( 0, k - self.numCols + 1 ), min( self.numRows - 1, k )
+
+    def bitIndex( self, r, c ):
+
+        k = r + c
+        return 8 * self.offsets[k] + r - max( 0, k - self.numCols + 1 )
+
+    def setPrevRow( self, r, c ):
+
+        i = self.bitIndex( r, c )
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    # Set the bits of diagonal k from a NumPy bool array, starting at
+    # its cell number 'first' (the cells before it must be unset).
+
+    def setDiagonal( self, k, fromRow, first=0 ):
+
+        if first % 8:
+            fromRow = np.concatenate( [ np.zeros( first % 8, dtype=bool ), fromRow ] )
+
+        packed = np.packbits( fromRow, bitorder='little' )
+        start  = self.offsets[k] + first // 8
+        self.bits[ start : start + len(packed) ] = packed.tobytes()
+
+    def get( self, r, c ):
+
+        i = self.bitIndex( r, c )
+        if self.bits[i >> 3] & (1 << (i & 7)):
+            return Dir.PREV_ROW
+        else:
+            return Dir.PREV_COL
+
+    def __getitem__( self, r ):
+
+        return PackedDirsRow( self, r )
+
+    def __len__( self ):
+
+        return self.numRows
+
+
+class PackedDirsRow(object):
+
+    def __init__( self, dirs, r ):
+
+        self.dirs = dirs
+        self.r    = r
+
+    def __getitem__( self, c ):
+
+        return self.dirs.get( self.r, c )
+
+
+# Banded DP table fill
+#
+# Adjacent slices are usually similar, so the min-cost path stays close
+# to the scaled diagonal from (0,0) to (n,m).  This fills only the
+# cells within 'band' cells of that diagonal, measured along the
+# longer side of the table: |c*n - r*m| <= band*min(n,m).  If the path
+# found touches the edge of the band, the band is doubled and the fill
+# redone, until the band covers the whole table.  When the path stays
+# inside, this costs about O((n+m)*band) instead of O(n*m).
+#
+# Cells outside the band count as unreachable; inside it the
+# arithmetic is that of fillTablePython(), so with a wide enough band
+# the result is the same.  Directions are kept in a PackedDirs.  With
+# useNumPy the band is swept one anti-diagonal at a time, otherwise
+# one row at a time.
+
+def fillTableBanded( verts0, verts1, cost='area', frame=None, band=8, useNumPy=False ):
+
+    n = len(verts1) - 1
+    m = len(verts0) - 1
+
+    # The band must be at least as wide as one step along the shorter
+    # side, or it would not contain any path.
+
+    band = max( band, -(-max(n,m) // min(n,m)) + 1 )
+
+    while True:
+
+        halfWidth = band * min(n,m)
+
+        if useNumPy:
+            minDir = fillBandNumPy( verts0, verts1, cost, frame, halfWidth )
+        else:
+            minDir = fillBandPython( verts0, verts1, cost, frame, halfWidth )
+
+        if halfWidth >= n*m: # the band is the whole table
+            return minDir
+
+        # Walk the path and see whether it touches the edge of the band
+
+        touches = False
+        r, c = n, m
+        while (r > 0 or c > 0) and not touches:
+            cLo, cHi = bandColumns( r, n, m, halfWidth )
+            touches = (c == cLo and cLo > 0) or (c == cHi and cHi < m)
+            if minDir.get( r, c ) == Dir.PREV_ROW:
+                r -= 1
+            else:
+                c -= 1
+
+        if not touches:
+            return minDir
+
+        band *= 2
+
+
+# Columns of row r inside the band |c*n - r*m| <= halfWidth
+
+def bandColumns( r, n, m, halfWidth ):
+
+    return max( 0, -((halfWidth - r*m) // n) ), min( m, (r*m + halfWidth) // n )
+
+
+def fillBandPython( verts0, verts1, cost, frame, halfWidth ):
+
+    costFn = costFunctions[cost][0]
+
+    n = len(verts1) - 1
+    m = len(verts0) - 1
+
+    inf = float('inf')
+
+    minDir = PackedDirs( n+1, m+1 )
+
+    prevCost = {}
+    for r in range( n+1 ):
+
+        cLo, cHi = bandColumns( r, n, m, halfWidth )
+
+        curCost = {}
+        for c in range( cLo, cHi+1 ):
+
+            if r == 0 and c == 0:
+                curCost[c] = 0  # Starting edge has zero cost
+                continue
+
+            if r > 0 and c in prevCost:
+                cost_from_row = prevCost[c] + costFn(verts1[r - 1], verts1[r], verts0[c], frame)
+            else:
+                cost_from_row = inf
+
+            if c > cLo:
+                cost_from_col = curCost[c - 1] + costFn(verts1[r], verts0[c], verts0[c - 1], frame)
+            else:
+                cost_from_col = inf
+
+            if cost_from_row < cost_from_col:
+                curCost[c] = cost_from_row
+                minDir.setPrevRow( r, c )
+            else:
+                curCost[c] = cost_from_col
+
+        prevCost = curCost
+
+    return minDir
+
+
+def fillBandNumPy( verts0, verts1, cost, frame, halfWidth ):
+
+    if np is None:
+        raise ImportError( 'the banded NumPy fill needs NumPy, which is not installed' )
+
+    costFn = costFunctions[cost][1]
+
+    p0 = np.array( verts0, dtype=np.float64 ) # columns
+    p1 = np.array( verts1, dtype=np.float64 ) # rows
+
+    n = len(p1) - 1
+    m = len(p0) - 1
+
+    minDir = PackedDirs( n+1, m+1 )
+
+    # Anti-diagonal k holds the cells (r,k-r), and the band limits r to
+    # bandLo[k] = (k*n - halfWidth)/(n+m) .. bandHi[k] = (k*n + halfWidth)/(n+m).
+
+    ks     = np.arange( n+m+1 )
+    bandLo = np.maximum( np.maximum( 0, ks - m ), -((halfWidth - ks*n) // (n+m)) )
+    bandHi = np.minimum( np.minimum( n, ks ),     (ks*n + halfWidth) // (n+m) )
+
+    # Step costs of all band cells in one batched pass, one row per
+    # diagonal: rows[k,i] is row bandLo[k]+i, clamped to the band.
+    #
+    # p1Prev[r] is verts1[r-1] and p0Prev[c] is verts0[c-1].  Their
+    # first rows wrap around, but are only used for steps from outside
+    # the table, whose cost is added to an infinite cost and so is
+    # never chosen.
+
+    p1Prev = np.concatenate( [ p1[-1:], p1[:-1] ] )
+    p0Prev = np.concatenate( [ p0[-1:], p0[:-1] ] )
+
+    width = int( (bandHi - bandLo).max() ) + 1
+    rows  = np.minimum( bandLo[:,None] + np.arange( width ), bandHi[:,None] )
+    cols  = ks[:,None] - rows
+
+    rowCost = costFn( p1Prev[rows], p1[rows], p0[cols], frame )
+    colCost = costFn( p1[rows], p0[cols], p0Prev[cols], frame )
+
+    prevCost = np.zeros( 1 ) # diagonal 0 is just (0,0)
+
+    for k in range( 1, n+m+1 ):
+
+        a, b     = int( bandLo[k] ), int( bandHi[k] )
+        pLo, pHi = int( bandLo[k-1] ), int( bandHi[k-1] )
+
+        # Costs of diagonal k-1 at rows a-1..b, unreachable outside
+        # its band.  Row a-1 is the 'up' neighbour of row a and row r
+        # the 'left' neighbour of row r.
+
+        prev = np.full( b-a+2, np.inf )
+        lo   = max( a-1, pLo )
+        hi   = min( b, pHi )
+        prev[lo-a+1:hi-a+2] = prevCost[lo-pLo:hi-pLo+1]
+
+        costFromRow = prev[:-1] + rowCost[k,:b-a+1]
+        costFromCol = prev[1:]  + colCost[k,:b-a+1]
+        fromRow     = costFromRow < costFromCol
+
+        prevCost = np.where( fromRow, costFromRow, costFromCol )
+
+        minDir.setDiagonal( k, fromRow, a - minDir.diagonalRows( k )[0] )
+
+    return minDir
+
+
+fillBackends = { 'python':        fillTablePython,
+                 'numpy':         fillTableNumPy,
+                 'python-packed': fillTablePythonPacked,
+                 'numpy-packed':  fillTableNumPyPacked }
+
+
+def defaultBackend():
+
+    if np is not None:
+        return 'numpy'
+    else:
+        return 'python'
+
+
+# Cache of slice pair tilings
+#
+# Maps a key made from both slices' coordinates and the tiling options
+# (see tilingKey()) to the index triples from tilePair(), so that a
+# pair is only tiled again if one of its slices has changed.  At most
+# 'maxEntries' tilings are kept in memory, dropping the least recently
+# used.  With a 'directory', tilings are also saved there, one file
+# each of little-endian int32 index triples, and looked up there when
+# not in memory, so that they last from one run to the next.  A file
+# that does not decode is a miss.  A cache can be shared by threads.
+
+class TilingCache(object):
+
+    def __init__( self, maxEntries=256, directory=None ):
+
+        self.maxEntries = maxEntries
+        self.directory  = directory
+        self.entries    = collections.OrderedDict() # key -> tris, most recently used last
+        self.hits       = 0
+        self.misses     = 0
+        self.lock       = threading.RLock()
+
+        if directory is not None:
+            os.makedirs( directory, exist_ok=True )
+
+    def __len__( self ):
+        return len(self.entries)
+
+    def get( self, key ):
+
+        with self.lock:
+
+            tris = self.entries.get( key )
+
+            if tris is None and self.directory is not None:
+                try:
+                    with open( self.entryPath( key ), 'rb' ) as f:
+                        tris = decodeTriples( f.read() )
+                except (OSError, ValueError):
+                    tris = None
+                if tris is not None:
+                    self.remember( key, tris )
+
+            if tris is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end( key )
+
+            return tris
+
+    def put( self, key, tris ):
+
+        with self.lock:
+
+            self.remember( key, tris )
+
+            if self.directory is not None: # write then rename, so that a reader never sees part of a file
+                path = self.entryPath( key )
+                with open( path + '.tmp', 'wb' ) as f:
+                    f.write( encodeTriples( tris ) )
+                os.replace( path + '.tmp', path )
+
+    def remember( self, key, tris ):
+
+        with self.lock:
+
+            self.entries[key] = tris
+            self.entries.move_to_end( key )
+
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem( last=False )
+
+    def clear( self ):
+
+        with self.lock:
+            self.entries.clear()
+
+    def entryPath( self, key ):
+
+        return os.path.join( self.directory, key + '.tris' )
+
+
+# Index triples as little-endian int32 bytes, for the tiling cache's
+# files, and back as a list of (i,j,k) tuples
+
+def encodeTriples( tris ):
+
+    return struct.pack( '<%di' % (3*len(tris)), *[ i for t in tris for i in t ] )
+
+
+def decodeTriples( data ):
+
+    if len(data) % 12 != 0:
+        raise ValueError( 'not a whole number of index triples' )
+
+    values = struct.unpack( '<%di' % (len(data) // 4), data )
+
+    return list( zip( values[0::3], values[1::3], values[2::3] ) )
+
+
+# Cache key for tiling slices with coordinates coords0 and coords1:
+# a digest of both coordinate buffers (as little-endian float64, so
+# the same with or without NumPy) and of the options that change the
+# result.  The fill backend does not change it.
+
+def tilingKey( coords0, coords1, optimal=False, cost='area', band=None ):
+
+    digest = hashlib.sha1( repr( ( len(coords0), len(coords1), bool(optimal), cost, band ) ).encode() )
+
+    for coords in ( coords0, coords1 ):
+        if np is not None and isinstance( coords, np.ndarray ):
+            digest.update( np.ascontiguousarray( coords, dtype='<f8' ).tobytes() )
+        else:
+            digest.update( struct.pack( '<%dd' % (3*len(coords)), *[ x for p in coords for x in p ] ) )
+
+    return digest.hexdigest()
+
+
+# Lazy meshing pipeline
+#
+#   iterSlices( f )  ->  iterSlicePairs( slices )  ->  iterTriangles( pairs )  ->  MeshWriter
+#
+# Each stage takes an iterable and pulls from it only as needed, so
+# reading, tiling and writing overlap and only a few slices are held at
+# a time.  See writeMeshStream().
+
+# Consecutive pairs ( slice0, slice1 ) from an iterable of slices, top
+# slice first as buildMesh() tiles them.  Slices in file order (as from
+# iterSlices()) are bottom first, so pass bottomFirst=True for those.
+
+def iterSlicePairs( slices, bottomFirst=False ):
+
+    prev = None
+
+    for slice in slices:
+        if prev is not None:
+            yield (slice, prev) if bottomFirst else (prev, slice)
+        prev = slice
+
+
+# Triangulate each pair of slices from an iterable, yielding
+# ( slice0, slice1, tris ) in the same order, with 'tris' as from
+# tilePair().
+#
+# With workers > 1 (or None, for one per CPU) the pairs are tiled in
+# a process pool.  Only the slice coordinates are sent to the workers,
+# which seed each pair (see tilePair()) as well as filling its table,
+# and only index triples come back.  Only a few pairs per worker are
+# taken from 'pairs' ahead of the one being yielded.  Closing the
+# generator early cancels the pairs that have not been started.
+#
+# With a TilingCache, pairs found in it are not tiled again, and new
+# tilings are added to it.
+
+def iterTriangles( pairs, backend=None, workers=1, optimal=False, cost='area', band=None, cache=None ):
+
+    def pairArgs( slice0, slice1, seed=True ): # without 'seed', tilePair() seeds the pair itself
+        start = seedPair( slice0, slice1 ) if seed and not optimal else None
+        return ( sliceCoords( slice0 ), sliceCoords( slice1 ), backend, optimal, cost, band, start )
+
+    def lookUp( slice0, slice1 ): # ( key, tris ), with tris None if not cached
+        if cache is None:
+            return None, None
+        key  = tilingKey( sliceCoords( slice0 ), sliceCoords( slice1 ), optimal, cost, band )
+        tris = cache.get( key )
+        if tris is not None:
+            counted( 'cache hits' )
+        return key, tris
+
+    if workers == 1:
+        for slice0, slice1 in pairs:
+            key, tris = lookUp( slice0, slice1 )
+            if tris is None:
+                tris = tilePair( *pairArgs( slice0, slice1 ) )
+                if cache is not None:
+                    cache.put( key, tris )
+            yield slice0, slice1, tris
+        return
+
+    def finish( slice0, slice1, key, result ): # 'result' is the tris or a future for them
+        if isinstance( result, concurrent.futures.Future ):
+            with timed( 'wait for workers' ):
+                result = result.result()
+            if cache is not None:
+                cache.put( key, result )
+        return slice0, slice1, result
+
+    maxPending = 2 * (workers or os.cpu_count() or 1)
+
+    with concurrent.futures.ProcessPoolExecutor( max_workers=workers ) as pool:
+
+        pending = collections.deque() # ( slice0, slice1, key, result ), oldest first
+
+        try:
+
+            for slice0, slice1 in pairs:
+
+                key, tris = lookUp( slice0, slice1 )
+                if tris is None:
+                    tris = pool.submit( tilePair, *pairArgs( slice0, slice1, seed=False ) )
+
+                pending.append( ( slice0, slice1, key, tris ) )
+
+                if len(pending) >= maxPending:
+                    yield finish( *pending.popleft() )
+
+            while pending:
+                yield finish( *pending.popleft() )
+
+        finally: # if the caller stops early, drop the pairs that no worker has started
+            for slice0, slice1, key, result in pending:
+                if isinstance( result, concurrent.futures.Future ):
+                    result.cancel()
+
+
+# Triangulate every consecutive pair of slices.  The result is a Mesh
+# over all the slices, with the triangles in slice-pair order.
+# progress( done, total ), if given, is called as each pair finishes.
+# See iterTriangles() for the other arguments.
+
+def buildMesh( slices, backend=None, workers=1, progress=None, optimal=False, cost='area', band=None, cache=None ):
+
+    for mesh, done, total in iterMesh( slices, backend, workers, optimal, cost, band, cache ):
+        if done and progress is not None:
+            progress( done, total )
+
+    return mesh
+
+
+# The same, step by step: yields ( mesh, done, total ) before the first
+# pair and again as each pair's triangles are added to the mesh, so
+# that a mesh can be shown as it grows (see Mesh.snapshot()).  Closing
+# the generator stops the tiling.
+
+def iterMesh( slices, backend=None, workers=1, optimal=False, cost='area', band=None, cache=None ):
+
+    mesh  = Mesh( slices )
+    total = max( 0, len(slices)-1 )
+
+    yield mesh, 0, total
+
+    for i, (slice0, slice1, tris) in enumerate( iterTriangles( iterSlicePairs( slices ), backend, workers, optimal, cost, band, cache ) ):
+        mesh.addPair( i, tris )
+        yield mesh, i+1, total
+
+
+# Same, as a sequence of Triangle objects (made as they are asked for)
+
+def buildAllTriangles( slices, backend=None, workers=1, progress=None, optimal=False, cost='area', band=None, cache=None ):
+
+    return buildMesh( slices, backend, workers, progress, optimal, cost, band, cache ).triangles()
+
+
+# Branching stacks
+#
+# A slice file may list several contours at the same height, one after
+# another, where the anatomy branches.  groupLayers() collects the
+# contours (Slice objects) at each height into a layer.  Between two
+# adjacent layers, matchContours() links contours whose outlines
+# overlap in the slice plane, and each connected group of linked
+# contours is tiled as one pair.  Where a group has several contours
+# on one side (a branch), they are first merged into one contour by
+# bridging them at their closest vertices (see mergeContours()), so
+# that every group goes through tilePair() like an ordinary pair and
+# all groups can be tiled together in a process pool.  A contour with
+# no link in the next layer is left open there.
+
+
+# Height of a contour: the mean y of its vertices
+
+def contourHeight( slice ):
+
+    if np is not None and isinstance( slice.coords, np.ndarray ):
+        return float( slice.coords[:,1].mean() )
+    else:
+        return sum( p[1] for p in slice.coords ) / len(slice.coords)
+
+
+# Layers (lists of contours) from contours in stack order, putting
+# together adjacent contours whose heights are within 'tolerance'
+
+def groupLayers( slices, tolerance=1e-6 ):
+
+    layer  = []
+    height = None
+
+    for slice in slices:
+
+        h = contourHeight( slice )
+
+        if layer and abs( h - height ) > tolerance:
+            yield layer
+            layer = []
+
+        if not layer:
+            height = h
+        layer.append( slice )
+
+    if layer:
+        yield layer
+
+
+# Bounding box of a contour in the slice plane: ( minX, maxX, minZ, maxZ )
+
+def contourBounds( slice ):
+
+    if np is not None and isinstance( slice.coords, np.ndarray ):
+        lo = slice.coords.min( axis=0 )
+        hi = slice.coords.max( axis=0 )
+        return ( float(lo[0]), float(hi[0]), float(lo[2]), float(hi[2]) )
+    else:
+        xs = [ p[0] for p in slice.coords ]
+        zs = [ p[2] for p in slice.coords ]
+        return ( min(xs), max(xs), min(zs), max(zs) )
+
+
+# Groups of contours to tile together between two adjacent layers, as
+# ( indices in layer0, indices in layer1 ).  Contours are linked if
+# their bounding boxes overlap; candidates are found with a KD-tree on
+# the centres of layer1's boxes.
+
+def matchContours( layer0, layer1 ):
+
+    bounds0 = [ contourBounds( c ) for c in layer0 ]
+    bounds1 = [ contourBounds( c ) for c in layer1 ]
+
+    def centre( b ):
+        return [ 0.5 * (b[0] + b[1]), 0.0, 0.5 * (b[2] + b[3]) ]
+
+    def radius( b ): # half the box diagonal
+        return 0.5 * math.sqrt( (b[1] - b[0])**2 + (b[3] - b[2])**2 )
+
+    tree       = KDTree( [ centre( b ) for b in bounds1 ] )
+    maxRadius1 = max( radius( b ) for b in bounds1 )
+
+    # Union-find over the contours of both layers (layer1's numbered after layer0's)
+
+    parent = list( range( len(layer0) + len(layer1) ) )
+
+    def root( i ):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    linked = set()
+
+    for i, b0 in enumerate( bounds0 ):
+        r = radius( b0 ) + maxRadius1
+        for j in tree.within( centre( b0 ), r*r ):
+            b1 = bounds1[j]
+            if b0[0] <= b1[1] and b1[0] <= b0[1] and b0[2] <= b1[3] and b1[2] <= b0[3]:
+                parent[ root( len(layer0) + j ) ] = root( i )
+                linked.add( i )
+                linked.add( len(layer0) + j )
+
+    groups = collections.OrderedDict()
+    for i in sorted( linked ):
+        group = groups.setdefault( root( i ), ( [], [] ) )
+        if i < len(layer0):
+            group[0].append( i )
+        else:
+            group[1].append( i - len(layer0) )
+
+    return list( groups.values() )
+
+
+# One contour made from several, and the index of each of its
+# vertices in a buffer where contours[k] starts at offsets[k]
+#
+# Each further contour is spliced in at the closest pair of vertices
+# (p in what is merged so far, q in the new contour): the merged
+# contour runs to p, jumps to q, goes once around the new contour back
+# to q, jumps back to p and carries on.  The two jumps are a bridge of
+# zero width, so the merged contour has the same orientation as its
+# parts.  A single contour is returned as it is.
+
+def mergeContours( contours, offsets ):
+
+    if len(contours) == 1:
+        return contours[0], list( range( offsets[0], offsets[0] + contours[0].numVerts() ) )
+
+    pts   = list( asPointList( contours[0].coords ) )
+    index = list( range( offsets[0], offsets[0] + len(pts) ) )
+
+    for contour, offset in zip( contours[1:], offsets[1:] ):
+
+        p, q = findClosestVertices( pts, None, contour.spatialIndex() )
+
+        n       = contour.numVerts()
+        loop    = [ (q + t) % n for t in range(n+1) ]
+        newPts  = asPointList( contour.coords )
+
+        pts   = pts[:p+1]   + [ newPts[i] for i in loop ]     + pts[p:]
+        index = index[:p+1] + [ offset + i for i in loop ]    + index[p:]
+
+    return Slice( pts ), index
+
+
+# Triangles from tilePair() as indices into the mesh, through the
+# index of each pair vertex (see mergeContours()).  Triangles that
+# collapse, across a bridge, are dropped.
+
+def remapTriangles( tris, index ):
+
+    if np is not None:
+        mapped = np.asarray( index, dtype=np.int32 )[ np.asarray( tris, dtype=np.intp ).reshape( -1, 3 ) ]
+        keep   = (mapped[:,0] != mapped[:,1]) & (mapped[:,1] != mapped[:,2]) & (mapped[:,2] != mapped[:,0])
+        return mapped[keep]
+    else:
+        mapped = [ tuple( index[i] for i in tri ) for tri in tris ]
+        return [ tri for tri in mapped if len( set(tri) ) == 3 ]
+
+
+# Triangulate a stack of layers (lists of contours, top first, as from
+# groupLayers()).  The result is a Mesh over all the contours in layer
+# order.  With one contour per layer this is the same as buildMesh().
+# See buildMesh() for the other arguments.
+
+def buildBranchingMesh( layers, backend=None, workers=1, progress=None, optimal=False, cost='area', band=None, cache=None ):
+
+    for mesh, done, total in iterBranchingMesh( layers, backend, workers, optimal, cost, band, cache ):
+        if done and progress is not None:
+            progress( done, total )
+
+    return mesh
+
+
+# The same, step by step, as iterMesh() is for buildMesh()
+
+def iterBranchingMesh( layers, backend=None, workers=1, optimal=False, cost='area', band=None, cache=None ):
+
+    layers = [ list( layer ) for layer in layers ]
+    mesh   = Mesh( [ c for layer in layers for c in layer ] )
+
+    firsts = [ 0 ] # index in mesh.slices of each layer's first contour
+    for layer in layers:
+        firsts.append( firsts[-1] + len(layer) )
+
+    tasks = [] # ( slice0, slice1, index ) per group
+
+    for l in range( len(layers) - 1 ):
+        for group0, group1 in matchContours( layers[l], layers[l+1] ):
+            slice0, index0 = mergeContours( [ layers[l][i]   for i in group0 ], [ mesh.offsets[firsts[l]   + i] for i in group0 ] )
+            slice1, index1 = mergeContours( [ layers[l+1][i] for i in group1 ], [ mesh.offsets[firsts[l+1] + i] for i in group1 ] )
+            tasks.append( ( slice0, slice1, index0 + index1 ) )
+
+    yield mesh, 0, len(tasks)
+
+    pairs = ( (slice0, slice1) for slice0, slice1, index in tasks )
+
+    for done, (task, (slice0, slice1, tris)) in enumerate( zip( tasks, iterTriangles( pairs, backend, workers, optimal, cost, band, cache ) ) ):
+        mesh.addTriangles( remapTriangles( tris, task[2] ) )
+        yield mesh, done+1, len(tasks)
+
+
+# Mesh
+#
+# The triangles between a stack of slices, as an int32 (T,3) array
+# 'tris' of indices into one vertex buffer 'coords' that holds the
+# vertices of all the slices in order (slice s starts at offsets[s]).
+# Without NumPy, 'coords' is a list of [x,y,z] and 'tris' a list of
+# (i,j,k) tuples.  Triangle and Vertex objects are only made when
+# asked for.
+#
+# With NumPy, addTriangles() keeps each added array in 'trisParts',
+# and 'tris' joins them, once, when it is next read, rather than
+# copying all the triangles so far for every slice pair.
+
+class Mesh(object):
+
+    def __init__( self, slices ):
+
+        self.slices  = slices
+        self.offsets = [ 0 ]
+        for slice in slices:
+            self.offsets.append( self.offsets[-1] + slice.numVerts() )
+
+        if np is not None:
+            if slices:
+                self.coords = np.concatenate( [ np.asarray( slice.coords, dtype=np.float64 ).reshape( -1, 3 ) for slice in slices ] )
+            else:
+                self.coords = np.zeros( (0,3) )
+            self.tris = np.zeros( (0,3), dtype=np.int32 )
+        else:
+            self.coords = [ p for slice in slices for p in slice.coords ]
+            self.tris   = []
+
+        self.normals = None # faceNormals(), once computed
+
+    def numVerts( self ):
+        return self.offsets[-1]
+
+    def numTriangles( self ):
+        return sum( len(part) for part in self.trisParts )
+
+    @property
+    def tris( self ):
+
+        if len(self.trisParts) > 1:
+            self.trisParts = [ np.concatenate( self.trisParts ) ]
+        return self.trisParts[0]
+
+    @tris.setter
+    def tris( self, tris ):
+        self.trisParts = [ tris ]
+
+    # Add the triangles from tilePair() between slices i and i+1
+
+    def addPair( self, i, tris ):
+
+        self.addTriangles( pairIndices( self.offsets[i], self.offsets[i+1], self.slices[i].numVerts(), tris ) )
+
+    # Add triangles that already index the vertex buffer, as an int32
+    # (T,3) array or (without NumPy) a list of (i,j,k) tuples
+
+    def addTriangles( self, tris ):
+
+        if np is not None:
+            self.trisParts.append( tris )
+        else:
+            self.tris += tris
+
+        self.normals = None
+
+    # Cross product of each triangle's edges v0->v1 and v0->v2: the
+    # outward normal, with length twice the triangle's area.  A (T,3)
+    # array, or a list of [x,y,z] without NumPy.
+
+    def faceCrossProducts( self ):
+
+        if np is not None:
+            corners = self.coords[ self.tris ]
+            return crossProducts( corners[:,1] - corners[:,0], corners[:,2] - corners[:,0] )
+        else:
+            coords = self.coords
+            return [ crossProduct( subtract( coords[j], coords[i] ), subtract( coords[k], coords[i] ) ) for i, j, k in self.tris ]
+
+    # Outward unit normal of each triangle, all in one pass (and kept
+    # until more triangles are added)
+
+    def faceNormals( self ):
+
+        if self.normals is None:
+            with timed( 'face normals' ):
+                self.normals = normalizes( self.faceCrossProducts() )
+
+        return self.normals
+
+    # Smooth unit normal at each vertex: the area-weighted mean of the
+    # normals of the triangles around it
+
+    def vertexNormals( self ):
+
+        if np is not None:
+            cross = self.faceCrossProducts()
+            sums  = np.zeros( (self.numVerts(), 3) )
+            for corner in range(3):
+                np.add.at( sums, self.tris[:,corner], cross )
+        else:
+            sums = [ [0.0,0.0,0.0] for i in range( self.numVerts() ) ]
+            for tri, cross in zip( self.tris, self.faceCrossProducts() ):
+                for i in tri:
+                    sums[i] = add( sums[i], cross )
+
+        return normalizes( sums )
+
+    def surfaceArea( self ):
+
+        if np is not None:
+            return 0.5 * float( lengths( self.faceCrossProducts() ).sum() )
+        else:
+            return 0.5 * sum( lengths( self.faceCrossProducts() ) )
+
+    # Enclosed volume, by the divergence theorem: positive if the
+    # triangles face outward.  Only meaningful once the mesh is closed.
+
+    def volume( self ):
+
+        return sum( triangleVolumes( self.coords, self.tris ) )
+
+    # Which triangles meet at each edge (see EdgeIndex)
+
+    def edgeIndex( self ):
+
+        return EdgeIndex( self.tris )
+
+    # Point the triangles of vertices that are at the same position
+    # (within about 'tolerance') at the first of them, dropping
+    # triangles that collapse
+
+    def weld( self, tolerance=0.0 ):
+
+        self.tris    = remapTriangles( self.tris, weldVertices( self.coords, tolerance ) )
+        self.normals = None
+
+    # Weld, orient and cap the mesh so that it is closed where it can
+    # be (see Mesh post-processing).  Returns a report of the result, as
+    # from EdgeIndex.report(), with the number of caps and pieces and
+    # the enclosed volume.
+
+    def close( self, tolerance=0.0 ):
+
+        with timed( 'close mesh' ):
+
+            self.weld( tolerance )
+
+            tris, pieces = orientTriangles( self.tris, EdgeIndex( self.tris ) )
+
+            index = EdgeIndex( tris )
+            loops = boundaryLoops( index )
+            for loop in loops:
+                caps = capLoop( self.coords, [ index.tails[h] for h in loop ] )
+                tris, pieces = addFaces( tris, pieces, caps, pieces[ loop[0] // 3 ] )
+
+            tris = outward( self.coords, tris, pieces )
+
+            self.tris    = tris
+            self.normals = None
+
+            report = EdgeIndex( tris ).report()
+
+        report['caps']   = len(loops)
+        report['pieces'] = int( max( pieces ) ) + 1 if len(pieces) else 0
+        report['volume'] = self.volume()
+
+        return report
+
+    # Vertex view of buffer row i
+
+    def vertex( self, i ):
+
+        s = bisect.bisect_right( self.offsets, i ) - 1
+        return Vertex( None, self.slices[s], i - self.offsets[s] )
+
+    def triangle( self, t ):
+
+        norm = self.faceNormals()[t]
+        if np is not None:
+            norm = norm.tolist()
+
+        counted( 'triangles made' )
+
+        return Triangle( [ self.vertex( int(i) ) for i in self.tris[t] ], norm )
+
+    # A copy that shares this mesh's vertices and its triangles so far,
+    # but not the triangles added to it later, e.g. to draw a mesh that
+    # another thread is still adding to
+
+    def snapshot( self ):
+
+        snap = Mesh( [] )
+        snap.slices  = self.slices
+        snap.offsets = self.offsets
+        snap.coords  = self.coords
+        if np is not None:
+            snap.trisParts = list( self.trisParts ) # not self.tris, which would join the parts under the other thread
+        else:
+            snap.tris = list( self.tris )
+
+        return snap
+
+    # All the triangles, as a sequence that makes each Triangle when it
+    # is first asked for
+
+    def triangles( self ):
+
+        return MeshTriangles( self )
+
+
+class MeshTriangles(collections.abc.Sequence):
+
+    def __init__( self, mesh ):
+
+        self.mesh  = mesh
+        self.made  = [ None ] * mesh.numTriangles() # Triangle objects made so far
+
+    def __len__( self ):
+        return len(self.made)
+
+    def __getitem__( self, t ):
+
+        if isinstance( t, slice ):
+            return [ self[i] for i in range( *t.indices( len(self) ) ) ]
+
+        if t < 0:
+            t += len(self)
+        if not 0 <= t < len(self):
+            raise IndexError( 'triangle index out of range' )
+
+        if self.made[t] is None:
+            self.made[t] = self.mesh.triangle( t )
+
+        return self.made[t]
+
+
+# Triangles from tilePair() for a pair of slices (with n0 vertices in
+# the first) as indices into a buffer of vertices where the two slices
+# start at off0 and off1.  The result is an int32 (T,3) array, or
+# (without NumPy) a list of (i,j,k) tuples.
+
+def pairIndices( off0, off1, n0, tris ):
+
+    off1 -= n0
+
+    if np is not None:
+        pairTris = np.array( tris, dtype=np.int32 ).reshape( -1, 3 )
+        pairTris += np.where( pairTris < n0, off0, off1 ).astype( np.int32 )
+        return pairTris
+    else:
+        return [ tuple( j + off0 if j < n0 else j + off1 for j in tri ) for tri in tris ]
+
+
+# Mesh post-processing
+#
+# Tiling makes only the walls between slices: the first and last
+# contours are left open, and tilePair() winds its row-step and
+# column-step triangles opposite ways.  Mesh.close() welds vertices at
+# the same position, winds all triangles the same way as their
+# neighbours (orientTriangles()), caps each boundary loop (the first
+# and last contours, and in a branching stack any contour with nothing
+# beyond it) by ear clipping, and turns each closed piece to face
+# outward.  An EdgeIndex, recording the triangles on each edge, drives
+# this and tells whether the result is watertight.
+
+
+# Index of the vertex that each vertex is welded to: the first vertex
+# at the same position, positions being snapped to a grid of spacing
+# 'tolerance' if it is not 0
+
+def weldVertices( coords, tolerance=0.0 ):
+
+    if np is not None:
+        keys = np.asarray( coords, dtype=np.float64 ).reshape( -1, 3 )
+        if len(keys) == 0:
+            return np.zeros( 0, dtype=np.int32 )
+        if tolerance > 0:
+            keys = np.round( keys / tolerance )
+        unique, first, inverse = np.unique( keys, axis=0, return_index=True, return_inverse=True )
+        return first[ inverse.ravel() ].astype( np.int32 )
+    else:
+        seen  = {} # position -> first vertex there
+        index = []
+        for i, p in enumerate( coords ):
+            key = tuple( round( x / tolerance ) for x in p ) if tolerance > 0 else tuple( p )
+            index.append( seen.setdefault( key, i ) )
+        return index
+
+
+# Edge index
+#
+# Half-edge h = 3*t + k runs along triangle t from its corner k to
+# corner k+1, from vertex tails[h] to heads[h].  Each undirected edge
+# is listed once, in no particular order, in 'edges' as (lo, hi).
+# halfEdges[h] is the edge of half-edge h, counts[e] the number of
+# half-edges on edge e and pairs[e] the first two of them (-1 if there
+# is no second).  In a closed manifold mesh each edge has two
+# half-edges, running opposite ways if the triangles on either side
+# are wound the same way.
+#
+# With NumPy the edges are found by sorting edge keys, otherwise by
+# hashing them.  The fields are arrays or lists accordingly.
+
+class EdgeIndex(object):
+
+    def __init__( self, tris ):
+
+        if np is not None:
+
+            tris  = np.asarray( tris, dtype=np.int64 ).reshape( -1, 3 )
+            tails = tris.ravel()
+            heads = tris[:,[1,2,0]].ravel()
+
+            lo     = np.minimum( tails, heads )
+            hi     = np.maximum( tails, heads )
+            stride = int( hi.max() ) + 1 if len(hi) else 1
+
+            keys, halfEdges, counts = np.unique( lo * stride + hi, return_inverse=True, return_counts=True )
+            halfEdges = halfEdges.ravel()
+
+            order  = np.argsort( halfEdges, kind='stable' )
+            starts = np.cumsum( counts ) - counts
+            pairs  = np.full( (len(keys), 2), -1, dtype=np.int64 )
+            pairs[:,0] = order[starts]
+            shared = counts > 1
+            pairs[shared,1] = order[starts[shared]+1]
+
+            self.edges = np.stack( [ keys // stride, keys % stride ], axis=-1 )
+
+        else:
+
+            tails = [ v for tri in tris for v in tri ]
+            heads = [ v for tri in tris for v in (tri[1], tri[2], tri[0]) ]
+
+            edgeIDs    = {} # (lo, hi) -> edge
+            self.edges = []
+            halfEdges  = []
+            counts     = []
+            pairs      = []
+
+            for h, (a, b) in enumerate( zip( tails, heads ) ):
+                key = (a, b) if a < b else (b, a)
+                e   = edgeIDs.get( key )
+                if e is None:
+                    e = edgeIDs[key] = len(self.edges)
+                    self.edges.append( key )
+                    counts.append( 0 )
+                    pairs.append( [ h, -1 ] )
+                elif counts[e] == 1:
+                    pairs[e][1] = h
+                counts[e] += 1
+                halfEdges.append( e )
+
+        self.tails     = tails
+        self.heads     = heads
+        self.halfEdges = halfEdges
+        self.counts    = counts
+        self.pairs     = pairs
+
+    def numEdges( self ):
+        return len(self.counts)
+
+    # Half-edges with no other half-edge on their edge
+
+    def boundaryHalfEdges( self ):
+
+        if np is not None:
+            return self.pairs[ self.counts == 1, 0 ].tolist()
+        else:
+            return [ pair[0] for pair, count in zip( self.pairs, self.counts ) if count == 1 ]
+
+    # The two half-edges of each edge that has exactly two, as two lists
+
+    def sharedHalfEdges( self ):
+
+        if np is not None:
+            pairs = self.pairs[ self.counts == 2 ]
+            return pairs[:,0].tolist(), pairs[:,1].tolist()
+        else:
+            pairs = [ pair for pair, count in zip( self.pairs, self.counts ) if count == 2 ]
+            return [ pair[0] for pair in pairs ], [ pair[1] for pair in pairs ]
+
+    # Counts of edges on the boundary, with more than two triangles, and
+    # between two triangles wound opposite ways, and whether the mesh
+    # is watertight (none of those)
+
+    def report( self ):
+
+        h0, h1 = self.sharedHalfEdges()
+        tails  = self.tails
+
+        if np is not None:
+            counts      = self.counts
+            boundary    = int( (counts == 1).sum() )
+            nonManifold = int( (counts > 2).sum() )
+            misoriented = int( (tails[h0] == tails[h1]).sum() ) if h0 else 0
+        else:
+            boundary    = self.counts.count( 1 )
+            nonManifold = sum( 1 for count in self.counts if count > 2 )
+            misoriented = sum( 1 for a, b in zip( h0, h1 ) if tails[a] == tails[b] )
+
+        return { 'triangles':        len(tails) // 3,
+                 'edges':            self.numEdges(),
+                 'boundaryEdges':    boundary,
+                 'nonManifoldEdges': nonManifold,
+                 'misorientedEdges': misoriented,
+                 'watertight':       boundary == 0 and nonManifold == 0 and misoriented == 0 }
+
+
+# Wind the triangles the same way as their neighbours across each edge
+# that two triangles share.  Returns the triangles, some with two
+# corners swapped, and the piece (connected set of triangles) that each
+# triangle is in, numbered from 0.  'index' is the EdgeIndex of 'tris'.
+# The pieces are walked from triangle to neighbouring triangle, so one
+# that cannot be oriented (like a Moebius strip) is left with some
+# misoriented edges.
+
+def orientTriangles( tris, index ):
+
+    numTris = len(tris)
+    h0, h1  = index.sharedHalfEdges()
+
+    if np is not None:
+        tails   = index.tails.tolist()
+        partner = np.full( 3*numTris, -1, dtype=np.int64 )
+        partner[h0] = h1
+        partner[h1] = h0
+        partner = partner.tolist()
+    else:
+        tails   = index.tails
+        partner = [ -1 ] * (3*numTris) # the other half-edge on each half-edge's edge, if it has two
+        for a, b in zip( h0, h1 ):
+            partner[a] = b
+            partner[b] = a
+
+    flip   = [ False ] * numTris
+    pieces = [ -1 ] * numTris
+    numPieces = 0
+
+    for first in range(numTris):
+
+        if pieces[first] >= 0:
+            continue
+
+        pieces[first] = numPieces
+        stack = [ first ]
+
+        while stack:
+            t = stack.pop()
+            for h in (3*t, 3*t+1, 3*t+2):
+                g = partner[h]
+                if g >= 0 and pieces[g//3] < 0:
+                    u = g//3
+                    pieces[u] = numPieces
+                    flip[u]   = flip[t] if tails[g] != tails[h] else not flip[t]
+                    stack.append( u )
+
+        numPieces += 1
+
+    return flipTriangles( tris, flip ), pieces
+
+
+# Triangles with corners 1 and 2 swapped where 'flip' is true
+
+def flipTriangles( tris, flip ):
+
+    if np is not None:
+        tris = np.array( tris, dtype=np.int32 ).reshape( -1, 3 )
+        rows = np.flatnonzero( np.asarray( flip, dtype=bool ) )
+        tris[rows] = tris[rows][:,[0,2,1]]
+        return tris
+    else:
+        return [ (a, c, b) if f else (a, b, c) for (a, b, c), f in zip( tris, flip ) ]
+
+
+# Triangles with 'faces' added to the end, all in piece 'piece'
+
+def addFaces( tris, pieces, faces, piece ):
+
+    if np is not None:
+        tris = np.concatenate( [ tris, np.array( faces, dtype=np.int32 ).reshape( -1, 3 ) ] )
+    else:
+        tris = tris + faces
+
+    return tris, pieces + [ piece ] * len(faces)
+
+
+# Loops of half-edges around the holes in a mesh whose triangles are
+# wound consistently, each in the direction that its triangles run
+# along it.  Where several holes meet at a vertex, the loops there are
+# split arbitrarily.  Chains that do not close are left out.
+
+def boundaryLoops( index ):
+
+    tails = index.tails
+    heads = index.heads
+
+    boundary = index.boundaryHalfEdges()
+    leaving  = {} # vertex -> boundary half-edges that start there
+    for h in boundary:
+        leaving.setdefault( int( tails[h] ), [] ).append( h )
+
+    loops = []
+
+    for first in boundary:
+
+        if first not in leaving.get( int( tails[first] ), () ):
+            continue # already in a loop
+
+        loop = []
+        h    = first
+        leaving[ int( tails[h] ) ].remove( h )
+
+        while True:
+            loop.append( h )
+            v = int( heads[h] )
+            if v == tails[first]:
+                loops.append( loop )
+                break
+            if not leaving.get( v ):
+                break
+            h = leaving[v].pop()
+
+    return loops
+
+
+# Triangles that cap a boundary loop, given as its vertices (indices
+# into coords) in the direction that the triangles beside it run along
+# it.  The caps go the other way around, so that they are wound the
+# same way as their neighbours.  The loop is projected onto the plane
+# across its vector area and filled by ear clipping.
+
+def capLoop( coords, loop ):
+
+    loop   = loop[::-1]
+    pts    = asPointList( coords[ np.asarray( loop, dtype=np.intp ) ] ) if np is not None else [ coords[i] for i in loop ]
+    normal = contourAreaVector( pts )
+
+    if length( normal ) == 0:
+        return []
+
+    normal = normalize( normal )
+    u      = normalize( crossProduct( normal, [1,0,0] if abs( normal[0] ) < 0.9 else [0,1,0] ) )
+    v      = crossProduct( normal, u ) # so the loop goes CCW in the (u,v) plane
+
+    flat = [ ( dotProduct( p, u ), dotProduct( p, v ) ) for p in pts ]
+
+    return [ ( loop[i], loop[j], loop[k] ) for i, j, k in earClip( flat ) ]
+
+
+# Triangles (i,j,k), each CCW, that fill a polygon given as a list of
+# (u,v) points in CCW order
+#
+# Each step clips an 'ear', a convex corner whose triangle holds no
+# other corner of the polygon.  Only reflex corners can lie inside an
+# ear, so only those are tested.  If no corner is an ear (the polygon
+# crosses itself), one is clipped anyway so that the hole is covered.
+
+def earClip( pts ):
+
+    n = len(pts)
+    if n < 3:
+        return []
+
+    before = [ n-1 ] + list( range(n-1) )
+    after  = list( range(1, n) ) + [ 0 ]
+
+    def turn( a, b, c ): # > 0 if a, b, c turn left
+
+        return (pts[b][0]-pts[a][0]) * (pts[c][1]-pts[b][1]) - (pts[b][1]-pts[a][1]) * (pts[c][0]-pts[b][0])
+
+    reflex = set( b for b in range(n) if turn( before[b], b, after[b] ) < 0 )
+
+    def isEar( b ):
+
+        a, c = before[b], after[b]
+
+        if b in reflex:
+            return False
+
+        for r in reflex:
+            if r != a and r != c and turn( a, b, r ) >= 0 and turn( b, c, r ) >= 0 and turn( c, a, r ) >= 0:
+                return False
+
+        return True
+
+    tris  = []
+    b     = 0
+    left  = n
+    tries = 0
+
+    while left > 3:
+
+        if isEar( b ) or tries >= left:
+
+            a, c = before[b], after[b]
+            tris.append( (a, b, c) )
+
+            after[a]  = c
+            before[c] = a
+            reflex.discard( b )
+            for v in (a, c):
+                if turn( before[v], v, after[v] ) < 0:
+                    reflex.add( v )
+                else:
+                    reflex.discard( v )
+
+            left -= 1
+            tries = 0
+            b     = a
+
+        else:
+            b = after[b]
+            tries += 1
+
+    tris.append( (before[b], b, after[b]) )
+
+    return tris
+
+
+# One line about a report from Mesh.close()
+
+def closeSummary( report ):
+
+    return '%s: %d caps, %d boundary, %d non-manifold and %d misoriented edges, volume %g' % (
+        'Watertight' if report['watertight'] else 'Not watertight', report['caps'], report['boundaryEdges'],
+        report['nonManifoldEdges'], report['misorientedEdges'], report['volume'] )
+
+
+# Signed volume of the tetrahedron from each triangle to the centre of
+# the vertices; their sum is the volume enclosed by a closed mesh
+
+def triangleVolumes( coords, tris ):
+
+    if len(tris) == 0:
+        return []
+
+    centre = centroid( coords )
+
+    if np is not None:
+        corners = np.asarray( coords, dtype=np.float64 )[ np.asarray( tris, dtype=np.intp ).reshape( -1, 3 ) ] - centre
+        return ( dotProducts( corners[:,0], crossProducts( corners[:,1], corners[:,2] ) ) / 6.0 ).tolist()
+    else:
+        rel = [ subtract( p, centre ) for p in coords ]
+        return [ dotProduct( rel[i], crossProduct( rel[j], rel[k] ) ) / 6.0 for i, j, k in tris ]
+
+
+# Triangles with every piece (see orientTriangles()) that encloses a
+# negative volume turned inside out, so that all face outward
+
+def outward( coords, tris, pieces ):
+
+    volumes = [ 0.0 ] * ( max( pieces ) + 1 if pieces else 0 )
+    for piece, volume in zip( pieces, triangleVolumes( coords, tris ) ):
+        volumes[piece] += volume
+
+    return flipTriangles( tris, [ volumes[piece] < 0 for piece in pieces ] )
+
+
+# Triangle cost functions
+#
+# Each cost is given as a pair of functions of a triangle's corners
+# ( v0, v1, v2 ) and the slice pair's 'frame' (see pairFrame()): one
+# for single [x,y,z] points, used by the pure-Python backend, and one
+# for NumPy arrays of points, used to compute whole cost tables at
+# once.  Both do the same arithmetic in the same order.
+#
+#   area      - triangle area (the default)
+#   perimeter - triangle perimeter, i.e. twice the length of the
+#               spanning edges, since the contour edges are always used
+#   normal    - area of the triangle projected onto the slice plane,
+#               which penalizes faces that deviate from the wall
+#               between the slices
+#   volume    - minus the volume of the tetrahedron from the triangle
+#               to the centre of the slice pair, so that minimizing
+#               maximizes the enclosed volume
+#
+# The fills pass each step's triangle wound the same way round: a row
+# step as ( verts1[r-1], verts1[r], verts0[c] ) and a column step as
+# ( verts1[r], verts0[c], verts0[c-1] ).  Only 'volume' depends on the
+# winding.
+
+
+def areaCost( v0, v1, v2, frame ):
+
+    return triangleArea( v0, v1, v2 )
+
+
+def areaCosts( v0, v1, v2, frame ):
+
+    return triangleAreas( v0, v1, v2 )
+
+
+def perimeterCost( v0, v1, v2, frame ):
+
+    return length( subtract( v1, v0 ) ) + length( subtract( v2, v1 ) ) + length( subtract( v0, v2 ) )
+
+
+def perimeterCosts( v0, v1, v2, frame ):
+
+    return lengths( v1 - v0 ) + lengths( v2 - v1 ) + lengths( v0 - v2 )
+
+
+def normalCost( v0, v1, v2, frame ):
+
+    return 0.5 * abs( dotProduct( crossProduct( subtract( v1, v0 ), subtract( v2, v0 ) ), frame[1] ) )
+
+
+def normalCosts( v0, v1, v2, frame ):
+
+    return 0.5 * np.abs( dotProducts( crossProducts( v1 - v0, v2 - v0 ), np.array( frame[1] ) ) )
+
+
+def volumeCost( v0, v1, v2, frame ):
+
+    centre = frame[0]
+
+    return -dotProduct( subtract( v0, centre ), crossProduct( subtract( v1, centre ), subtract( v2, centre ) ) ) / 6.0
+
+
+def volumeCosts( v0, v1, v2, frame ):
+
+    centre = np.array( frame[0] )
+
+    return -dotProducts( v0 - centre, crossProducts( v1 - centre, v2 - centre ) ) / 6.0
+
+
+costFunctions = { 'area':      (areaCost,      areaCosts),
+                  'perimeter': (perimeterCost, perimeterCosts),
+                  'normal':    (normalCost,    normalCosts),
+                  'volume':    (volumeCost,    volumeCosts) }
+
+
+# Frame of a slice pair, for the cost functions: the centre of all the
+# points, and the unit axis from the centroid of the first contour to
+# that of the second (+y if they coincide).
+
+def pairFrame( pts0, pts1 ):
+
+    centroid0 = centroid( pts0 )
+    centroid1 = centroid( pts1 )
+
+    centre = scalarMult( 1.0/(len(pts0)+len(pts1)), add( scalarMult( len(pts0), centroid0 ), scalarMult( len(pts1), centroid1 ) ) )
+
+    axis = subtract( centroid1, centroid0 )
+    if length( axis ) > 0.0001:
+        axis = normalize( axis )
+    else:
+        axis = [0,1,0]
+
+    return centre, axis
+
+
+# Read slices from a file
+# Each 'pointA-B' above is 'x y z' separated by spaces.
+#
+# The file is read as one stream of numbers, without regard to line
+# breaks: the slice count, then for each slice its point count and
+# 3 numbers per point.  With NumPy the file is memory-mapped and
+# converted a block at a time, so that large files need neither a
+# list of lines nor an object per number.
+
+class NumberStream(object):
+
+    def __init__( self, f, blockSize=1<<20 ):
+
+        self.blocks  = numberBlocks( f, blockSize )
+        self.pending = []  # parts of the current block not yet taken
+        self.count   = 0   # numbers taken so far (for error messages)
+
+    # Next k numbers, as an array (or list without NumPy)
+
+    def take( self, k ):
+
+        parts = []
+        have  = 0
+
+        while have < k:
+
+            if not self.pending:
+                block = next( self.blocks, None )
+                if block is None:
+                    raise ValueError( 'slice file ends after %d numbers; expected %d more' % (self.count + have, k - have) )
+                self.pending = [ block ]
+
+            part = self.pending.pop()
+            if have + len(part) > k:
+                self.pending = [ part[k-have:] ]
+                part = part[:k-have]
+
+            parts.append( part )
+            have += len(part)
+
+        self.count += k
+
+        if len(parts) == 1:
+            return parts[0]
+        elif np is not None:
+            return np.concatenate( parts )
+        else:
+            return [ n for part in parts for n in part ]
+
+    # A count: one non-negative integer
+
+    def takeCount( self, what ):
+
+        n = self.take( 1 )[0]
+        if n != int(n) or n < 0:
+            raise ValueError( 'bad %s count %g after %d numbers in slice file' % (what, n, self.count-1) )
+        return int(n)
+
+    # Whether any numbers remain
+
+    def atEnd( self ):
+
+        while not self.pending:
+            block = next( self.blocks, None )
+            if block is None:
+                return True
+            if len(block) > 0:
+                self.pending = [ block ]
+
+        return False
+
+
+# Blocks of numbers from 'f', each cut at a line break
+
+def numberBlocks( f, blockSize ):
+
+    if np is None: # stream lines
+
+        block = []
+        for line in f:
+            try:
+                block.extend( float(n) for n in line.split() )
+            except ValueError:
+                raise ValueError( 'bad number in slice file line %r' % line.strip() )
+            if len(block) >= blockSize // 8:
+                yield block
+                block = []
+
+        if block:
+            yield block
+
+        return
+
+    data = mapFile( f )
+
+    try:
+        start = 0
+        while start < len(data):
+
+            end = data.find( b'\n', min( start + blockSize, len(data) ) )
+            if end < 0:
+                end = len(data)
+
+            yield parseNumbers( data[start:end] )
+            start = end + 1
+
+    finally:
+        if hasattr( data, 'close' ):
+            data.close()
+
+
+# The contents of 'f' as bytes, memory-mapped if 'f' is a real file
+
+def mapFile( f ):
+
+    try:
+        return mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        pass # not a file, or empty
+
+    data = f.read()
+    if isinstance( data, str ):
+        data = data.encode()
+
+    return data
+
+
+def parseNumbers( text ):
+
+    with warnings.catch_warnings():
+        warnings.simplefilter( 'error', DeprecationWarning ) # NumPy warns, then stops, at a bad number
+        try:
+            return np.fromstring( text, dtype=np.float64, sep=' ' )
+        except (ValueError, DeprecationWarning):
+            raise ValueError( 'bad number in slice file near %r' % bytes(text[:40]) )
+
+
+# Yield the slices in file order
+
+def iterSlices( f, blockSize=1<<20 ):
+
+    numbers   = NumberStream( f, blockSize )
+    numSlices = numbers.takeCount( 'slice' )
+
+    for i in range(numSlices):
+
+        numPoints = numbers.takeCount( 'point' )
+        if numPoints == 0:
+            raise ValueError( 'slice %d of slice file has no points' % i )
+
+        coords = numbers.take( 3 * numPoints )
+
+        if np is not None:
+            yield Slice( coords.reshape( numPoints, 3 ) )
+        else:
+            yield Slice( [ coords[j:j+3] for j in range(0, len(coords), 3) ] )
+
+    if not numbers.atEnd():
+        raise ValueError( 'slice file has data after its %d slices' % numSlices )
+
+
+def readSlices( f ):
+
+    with timed( 'read' ):
+        slices = list( iterSlices( f ) )
+
+    slices.reverse() # so that first slice is on top
+
+    return slices
+
+
+
+# Binary slice stack
+#
+#   header   'SLCSTACK', then little-endian uint32 version (1), bytes
+#            per coordinate (4 or 8), number of slices, and 0 (padding)
+#   offsets  one uint64 per slice, plus one: the byte offset in the
+#            file of each slice's coordinates, so that slice i has
+#            (offsets[i+1] - offsets[i]) / (3 * bytes per coordinate) points
+#   coords   x y z per point, little-endian float32 or float64
+#
+# Slices are stored top first, in the order readSlices() returns them.
+# A SliceStack reads one slice at a time straight from the mapped file
+# (without copying, for float64 with NumPy), so any slice pair can be
+# fetched without reading the rest of the stack.  Coordinates mapped
+# this way are read-only.  The same Slice object is returned for an
+# index as long as it is in use elsewhere, so that streaming through a
+# stack does not keep every slice.
+
+stackMagic      = b'SLCSTACK'
+stackVersion    = 1
+stackHeader     = struct.Struct( '<8s4I' )
+stackCoordTypes = { 4: 'f', 8: 'd' }
+
+
+def writeSliceStack( f, slices, coordSize=8 ):
+
+    if coordSize not in stackCoordTypes:
+        raise ValueError( 'coordinates must be 4 or 8 bytes, not %r' % coordSize )
+
+    offsets = [ stackHeader.size + 8 * (len(slices)+1) ]
+    for slice in slices:
+        offsets.append( offsets[-1] + 3 * coordSize * slice.numVerts() )
+
+    f.write( stackHeader.pack( stackMagic, stackVersion, coordSize, len(slices), 0 ) )
+    f.write( struct.pack( '<%dQ' % len(offsets), *offsets ) )
+
+    for slice in slices:
+        if np is not None:
+            f.write( np.asarray( slice.coords, dtype='<f%d' % coordSize ).tobytes() )
+        else:
+            f.write( struct.pack( '<%d%s' % (3*slice.numVerts(), stackCoordTypes[coordSize]), *[ x for p in slice.coords for x in p ] ) )
+
+
+class SliceStack(collections.abc.Sequence):
+
+    # 'data' is the file contents, as bytes or an mmap
+
+    def __init__( self, data ):
+
+        if len(data) < stackHeader.size:
+            raise ValueError( 'slice stack is too short for its header' )
+
+        magic, version, coordSize, numSlices, padding = stackHeader.unpack_from( data, 0 )
+
+        if magic != stackMagic:
+            raise ValueError( 'not a slice stack' )
+        if version != stackVersion:
+            raise ValueError( 'slice stack version %d is not supported' % version )
+        if coordSize not in stackCoordTypes:
+            raise ValueError( 'bad slice stack coordinate size %d' % coordSize )
+        if len(data) < stackHeader.size + 8*(numSlices+1):
+            raise ValueError( 'slice stack is truncated' )
+
+        self.data     = data
+        self.coordSize = coordSize
+        self.offsets   = struct.unpack_from( '<%dQ' % (numSlices+1), data, stackHeader.size )
+        self.slices    = weakref.WeakValueDictionary() # Slice objects in use, by index
+
+        for i in range(numSlices):
+            if self.offsets[i+1] < self.offsets[i] or (self.offsets[i+1] - self.offsets[i]) % (3*coordSize) != 0:
+                raise ValueError( 'bad slice stack offset for slice %d' % i )
+        if self.offsets[-1] > len(data):
+            raise ValueError( 'slice stack is truncated' )
+
+    def __len__( self ):
+        return len(self.offsets) - 1
+
+    # Points in slice i, without making the slice
+
+    def numPoints( self, i ):
+        return (self.offsets[i+1] - self.offsets[i]) // (3*self.coordSize)
+
+    def __getitem__( self, i ):
+
+        if isinstance( i, slice ):
+            return [ self[j] for j in range( *i.indices( len(self) ) ) ]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError( 'slice index out of range' )
+
+        s = self.slices.get( i )
+
+        if s is None:
+
+            n = self.numPoints( i )
+
+            if np is not None:
+                coords = np.frombuffer( self.data, dtype='<f%d' % self.coordSize, count=3*n, offset=self.offsets[i] ).reshape( n, 3 )
+                s = Slice( coords, copy=False )
+            else:
+                values = struct.unpack_from( '<%d%s' % (3*n, stackCoordTypes[self.coordSize]), self.data, self.offsets[i] )
+                s = Slice( [ list( values[j:j+3] ) for j in range(0, 3*n, 3) ] )
+
+            self.slices[i] = s
+
+        return s
+
+
+def openSliceStack( filename ):
+
+    with open( filename, 'rb' ) as f:
+        return SliceStack( mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ ) )
+
+
+# Slices from a file in either format, top first
+
+def loadSlices( filename ):
+
+    with open( filename, 'rb' ) as f:
+        if not isSliceStack( f ):
+            return readSlices( f )
+
+    return openSliceStack( filename )
+
+
+# Whether binary file 'f' is a slice stack (f is left at the start)
+
+def isSliceStack( f ):
+
+    magic = f.read( len(stackMagic) )
+    f.seek( 0 )
+
+    return magic == stackMagic
+
+
+
+# Write a mesh as ASCII PLY
+#
+# Vertices are written once, in slice order, and the faces index into
+# them.  'f' is a text file.
+
+def writePLY( f, mesh ):
+
+    f.write( 'ply\n' )
+    f.write( 'format ascii 1.0\n' )
+    f.write( 'element vertex %d\n' % mesh.numVerts() )
+    f.write( 'property float x\n' )
+    f.write( 'property float y\n' )
+    f.write( 'property float z\n' )
+    f.write( 'element face %d\n' % mesh.numTriangles() )
+    f.write( 'property list uchar int vertex_indices\n' )
+    f.write( 'end_header\n' )
+
+    for p in asPointList( mesh.coords ):
+        f.write( '%r %r %r\n' % tuple(p) )
+
+    for tri in asPointList( mesh.tris ):
+        f.write( '3 %d %d %d\n' % tuple(tri) )
+
+
+
+# Streaming mesh writers
+#
+# A writer takes the triangles one slice pair at a time, through
+# addSlicePair( slice0, slice1, tris ) with 'tris' as from tilePair(),
+# and writes them out as they come, so that a whole stack can be meshed
+# and saved without holding all of its triangles.  Each slice's
+# vertices are written once, when the slice is first seen, and shared
+# by the triangles on both sides of it; a writer only remembers the
+# slices of the last pair, so pairs must come in stack order.
+#
+# A writer can instead be made with all of the slices, which writes
+# their vertices straight away; addPair( i, tris ) then adds the pair
+# of slices i and i+1, in any order.
+#
+# Call finish() after the last pair.  'f' is a binary file, which must
+# be seekable for PLY and STL since their counts are filled in by
+# finish().
+#
+# Each format defines writeHeader(), writeVertices( coords ) and
+# writeTriangles( coords, tris, globalTris ), where 'tris' index the
+# list of buffers 'coords' taken end to end, and 'globalTris' index
+# all the vertices written.
+
+class MeshWriter(object):
+
+    def __init__( self, f, slices=None ):
+
+        self.f            = f
+        self.slices       = slices
+        self.sliceOffsets = {} # slice -> index of its first vertex
+        self.numVertices  = 0
+        self.numTriangles = 0
+
+        self.writeHeader()
+
+        if slices is not None:
+            for slice in slices:
+                self.addSlice( slice )
+
+    # Index of slice's first vertex, writing its vertices if not yet written
+
+    def addSlice( self, slice ):
+
+        if slice not in self.sliceOffsets:
+
+            self.sliceOffsets[slice] = self.numVertices
+            self.numVertices += slice.numVerts()
+            self.writeVertices( slice.coords )
+
+        return self.sliceOffsets[slice]
+
+    def addSlicePair( self, slice0, slice1, tris ):
+
+        off0 = self.addSlice( slice0 )
+        off1 = self.addSlice( slice1 )
+
+        if self.slices is None: # only the next pair can share these
+            self.sliceOffsets = { slice0: off0, slice1: off1 }
+
+        pairTris = pairIndices( off0, off1, slice0.numVerts(), tris )
+
+        self.writeTriangles( [ slice0.coords, slice1.coords ], tris, pairTris )
+        self.numTriangles += len(pairTris)
+
+    def addPair( self, i, tris ):
+
+        self.addSlicePair( self.slices[i], self.slices[i+1], tris )
+
+    # Add triangles that already index the vertices written so far, as
+    # from Mesh.tris; 'coords' holds those vertices
+
+    def addTriangles( self, tris, coords ):
+
+        self.writeTriangles( [ coords ], tris, tris )
+        self.numTriangles += len(tris)
+
+    def finish( self ):
+
+        pass
+
+
+# Binary little-endian PLY, with float vertices and int indices.  PLY
+# needs all the vertices before any face, so the faces are spooled to
+# a temporary file and copied after the vertices by finish().
+
+class PLYWriter(MeshWriter):
+
+    countFormat = '%010d' # fixed width, so that counts can be written over
+
+    def writeHeader( self ):
+
+        self.f.write( b'ply\n'
+                      b'format binary_little_endian 1.0\n'
+                      b'element vertex ' )
+        self.vertexCountPos = self.f.tell()
+        self.f.write( ( self.countFormat % 0 + '\n'
+                        'property float x\n'
+                        'property float y\n'
+                        'property float z\n'
+                        'element face ' ).encode() )
+        self.faceCountPos = self.f.tell()
+        self.f.write( ( self.countFormat % 0 + '\n'
+                        'property list uchar int vertex_indices\n'
+                        'end_header\n' ).encode() )
+
+        self.faces = tempfile.TemporaryFile()
+
+    def writeVertices( self, coords ):
+
+        if np is not None:
+            self.f.write( np.asarray( coords, dtype='<f4' ).tobytes() )
+        else:
+            self.f.write( struct.pack( '<%df' % (3*len(coords)), *[ x for p in coords for x in p ] ) )
+
+    def writeTriangles( self, coords, tris, pairTris ):
+
+        if np is not None:
+            faces = np.empty( len(pairTris), dtype=[ ('n', 'u1'), ('v', '<i4', 3) ] )
+            faces['n'] = 3
+            faces['v'] = pairTris
+            self.faces.write( faces.tobytes() )
+        else:
+            self.faces.write( b''.join( struct.pack( '<B3i', 3, *tri ) for tri in pairTris ) )
+
+    def finish( self ):
+
+        self.faces.seek( 0 )
+        shutil.copyfileobj( self.faces, self.f )
+        self.faces.close()
+
+        end = self.f.tell()
+        self.f.seek( self.vertexCountPos )
+        self.f.write( ( self.countFormat % self.numVertices ).encode() )
+        self.f.seek( self.faceCountPos )
+        self.f.write( ( self.countFormat % self.numTriangles ).encode() )
+        self.f.seek( end )
+
+
+# Binary STL.  STL has no shared vertices, so each triangle's corners
+# are looked up in its own slice pair.
+
+class STLWriter(MeshWriter):
+
+    def writeHeader( self ):
+
+        self.f.write( b'Slice mesh'.ljust( 80, b' ' ) )
+        self.countPos = self.f.tell()
+        self.f.write( struct.pack( '<I', 0 ) )
+
+    def writeVertices( self, coords ):
+
+        pass
+
+    def writeTriangles( self, coords, tris, pairTris ):
+
+        if np is not None:
+            coords  = np.concatenate( [ np.asarray( c, dtype=np.float64 ).reshape( -1, 3 ) for c in coords ] )
+            corners = coords[ np.asarray( tris, dtype=np.intp ).reshape( -1, 3 ) ]
+            norms   = normalizes( crossProducts( corners[:,1] - corners[:,0], corners[:,2] - corners[:,0] ) )
+
+            facets = np.zeros( len(corners), dtype=[ ('norm', '<f4', 3), ('v', '<f4', (3,3)), ('attr', '<u2') ] )
+            facets['norm'] = norms
+            facets['v']    = corners
+            self.f.write( facets.tobytes() )
+        else:
+            coords = [ p for c in coords for p in c ]
+            for tri in tris:
+                corners = [ coords[j] for j in tri ]
+                norm    = normalize( crossProduct( subtract( corners[1], corners[0] ), subtract( corners[2], corners[0] ) ) )
+                self.f.write( struct.pack( '<12fH', *(norm + corners[0] + corners[1] + corners[2] + [0]) ) )
+
+    def finish( self ):
+
+        end = self.f.tell()
+        self.f.seek( self.countPos )
+        self.f.write( struct.pack( '<I', self.numTriangles ) )
+        self.f.seek( end )
+
+
+# Wavefront OBJ (text, but written to a binary file like the others).
+# Vertices and faces are interleaved, each face after its vertices.
+
+class OBJWriter(MeshWriter):
+
+    def writeHeader( self ):
+
+        self.f.write( b'# Slice mesh\n' )
+
+    def writeVertices( self, coords ):
+
+        self.f.write( ''.join( 'v %r %r %r\n' % tuple(p) for p in asPointList( coords ) ).encode() )
+
+    def writeTriangles( self, coords, tris, pairTris ):
+
+        self.f.write( ''.join( 'f %d %d %d\n' % (i+1, j+1, k+1) for i, j, k in asPointList( pairTris ) ).encode() )
+
+
+meshWriters = { 'ply': PLYWriter,
+                'stl': STLWriter,
+                'obj': OBJWriter }
+
+
+# Triangulate every consecutive pair of slices and write each pair's
+# triangles to 'f' as they come, in the given format (a key of
+# meshWriters).  'slices' can be any iterable, such as iterSlices( f )
+# (with bottomFirst=True; see iterSlicePairs()), and is read only as
+# far as the tiling has got.  Returns the number of triangles written.
+# See buildMesh() for the other arguments; 'total' is given to
+# progress() as None if 'slices' has no length.
+
+def writeMeshStream( f, slices, format='ply', backend=None, workers=1, progress=None, optimal=False, cost='area', band=None, bottomFirst=False, cache=None ):
+
+    total = len(slices) - 1 if hasattr( slices, '__len__' ) else None
+
+    writer = meshWriters[format]( f )
+
+    for done, (slice0, slice1, tris) in enumerate( iterTriangles( iterSlicePairs( slices, bottomFirst ), backend, workers, optimal, cost, band, cache ) ):
+        writer.addSlicePair( slice0, slice1, tris )
+        if progress is not None:
+            progress( done+1, total )
+
+    writer.finish()
+
+    return writer.numTriangles
+
+
+
+# Progress callback for buildMesh() that counts down on one line
+# (or up, if the total is not known)
+
+def showProgress( done, total ):
+
+    if total is None:
+        sys.stdout.write( '\r%d done ' % done )
+    else:
+        sys.stdout.write( '\r%d left ' % (total-done) )
+    sys.stdout.flush()
+
+
+
+# Mesh a slice file without opening a window
+
+def meshCommand( args ):
+
+    parser = argparse.ArgumentParser( prog='%s mesh' % sys.argv[0],
+                                      description='Triangulate all slices in a file and write a mesh.' )
+    parser.add_argument( 'filename' )
+    parser.add_argument( '-o', '--output', help='output mesh file (default: input with the format\'s extension)' )
+    parser.add_argument( '--format', choices=sorted(meshWriters) + ['ascii-ply'],
+                         help='binary PLY, binary STL, OBJ or ASCII PLY (default: from the output extension, else ply)' )
+    parser.add_argument( '--backend', choices=sorted(fillBackends), help='DP table fill (default: numpy if installed)' )
+    parser.add_argument( '-j', '--workers', type=int, default=1, help='number of worker processes (0 for one per CPU)' )
+    parser.add_argument( '--optimal', action='store_true', help='minimum-cost tiling over all starting edges (slower)' )
+    parser.add_argument( '--cost', choices=sorted(costFunctions), default='area', help='per-triangle cost to minimize (default: area)' )
+    parser.add_argument( '--band', type=int, help='only fill DP cells within this many cells of the diagonal (widened as needed)' )
+    parser.add_argument( '--decimate', type=float, metavar='TOL', help='drop contour points that are within TOL of the simplified contour' )
+    parser.add_argument( '--resample', type=int, metavar='N', help='resample each contour to N evenly spaced points' )
+    parser.add_argument( '--spacing', type=float, help='resample each contour to points about this far apart' )
+    parser.add_argument( '--branching', action='store_true', help='treat adjacent contours at the same height as one layer, and tile branches between layers' )
+    parser.add_argument( '--close', action='store_true', help='cap the open ends and orient the triangles outward, and report watertightness and volume' )
+    parser.add_argument( '--weld', type=float, default=0.0, metavar='TOL', help='with --close, also merge vertices within about TOL of each other (default: only coincident ones)' )
+    parser.add_argument( '--cache', metavar='DIR', help='keep slice pair tilings in this directory and reuse them in later runs' )
+    parser.add_argument( '--stats', metavar='FILE', help='write timers and counters to FILE (JSON if it ends in .json, else pstats format)' )
+    parser.add_argument( '--profile', metavar='FILE', help='run under cProfile and write its stats to FILE' )
+    args = parser.parse_args( args )
+
+    if args.stats:
+        enableStats()
+
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    cache = TilingCache( directory=args.cache ) if args.cache else None
+
+    format = args.format
+    if format is None:
+        extension = os.path.splitext( args.output or '' )[1].lower().lstrip( '.' )
+        format = extension if extension in meshWriters else 'ply'
+
+    output = args.output
+    if output is None:
+        output = os.path.splitext( args.filename )[0] + '.' + format.split( '-' )[-1]
+
+    report = None
+
+    if args.branching or args.close or format == 'ascii-ply': # these need the whole mesh
+
+        slices = list( simplifySlices( loadSlices( args.filename ), args.decimate, args.resample, args.spacing ) )
+
+        if args.branching: # every layer, to match contours between them
+            layers = list( groupLayers( slices ) )
+            print( 'Read %d contours in %d layers' % (len(slices), len(layers)) )
+            mesh = buildBranchingMesh( layers, args.backend, args.workers or None, showProgress, args.optimal, args.cost, args.band, cache )
+        else:
+            print( 'Read %d slices' % len(slices) )
+            mesh = buildMesh( slices, args.backend, args.workers or None, showProgress, args.optimal, args.cost, args.band, cache )
+
+        if args.close:
+            report = mesh.close( args.weld )
+
+        if format == 'ascii-ply':
+            with open( output, 'w' ) as f:
+                writePLY( f, mesh )
+        else:
+            with open( output, 'wb' ) as out:
+                writer = meshWriters[format]( out, mesh.slices )
+                writer.addTriangles( mesh.tris, mesh.coords )
+                writer.finish()
+
+        numTriangles = mesh.numTriangles()
+
+    else: # read, tile and write each slice pair as it comes
+
+        with open( args.filename, 'rb' ) as f, open( output, 'wb' ) as out:
+
+            if isSliceStack( f ):
+                slices, bottomFirst = openSliceStack( args.filename ), False
+            else:
+                slices, bottomFirst = iterSlices( f ), True
+
+            if args.decimate is not None or args.resample is not None or args.spacing is not None:
+                slices = simplifySlices( slices, args.decimate, args.resample, args.spacing )
+
+            numTriangles = writeMeshStream( out, slices, format, args.backend, args.workers or None, showProgress,
+                                            args.optimal, args.cost, args.band, bottomFirst, cache )
+
+    sys.stdout.write( '\r          \n' )
+
+    print( 'Wrote %d triangles to %s' % (numTriangles, output) )
+
+    if report is not None:
+        print( closeSummary( report ) )
+
+    if args.profile:
+        profiler.disable()
+        profiler.dump_stats( args.profile )
+
+    if args.stats:
+        if args.stats.endswith( '.json' ):
+            with open( args.stats, 'w' ) as f:
+                stats.dumpJSON( f )
+        else:
+            stats.dumpProfile( args.stats )
+
+
+
+def convertCommand( args ):
+
+    parser = argparse.ArgumentParser( prog='%s convert' % sys.argv[0],
+                                      description='Convert a slice file to a binary slice stack.' )
+    parser.add_argument( 'filename' )
+    parser.add_argument( '-o', '--output', help='output stack file (default: input with .slc extension)' )
+    parser.add_argument( '--float32', action='store_true', help='store coordinates as float32 rather than float64' )
+    args = parser.parse_args( args )
+
+    output = args.output
+    if output is None:
+        output = os.path.splitext( args.filename )[0] + '.slc'
+
+    slices = loadSlices( args.filename )
+
+    with open( output, 'wb' ) as f:
+        writeSliceStack( f, slices, 4 if args.float32 else 8 )
+
+    print( 'Wrote %d slices to %s' % (len(slices), output) )
+
+
+
+def main():
+
+    # Check command-line args
+
+    if len(sys.argv) < 2:
+        print( 'Usage: %s filename' % sys.argv[0] )
+        print( '       %s mesh filename [-o output.ply|.stl|.obj]' % sys.argv[0] )
+        print( '       %s convert filename [-o output.slc]' % sys.argv[0] )
+        sys.exit(1)
+
+    args = sys.argv[1:]
+
+    if args[0] == 'mesh':
+        meshCommand( args[1:] )
+    elif args[0] == 'convert':
+        convertCommand( args[1:] )
+    else:
+        import viewer # only needs OpenGL and GLFW if the viewer is run
+        viewer.main( args[0] )
     
 
 
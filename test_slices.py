@@ -0,0 +1,142 @@
+# Checks for slices.py
+#
+# Run with pytest, or as: python test_slices.py
+
+import os, tempfile
+
+import slices
+from bench import syntheticContour, syntheticStack
+
+
+here = os.path.dirname( os.path.abspath( __file__ ) )
+
+
+# Pairs of contours to tile: the test file's, a femur pair, and
+# synthetic ones of uneven and very small sizes
+
+def contourPairs():
+
+    pairs = []
+
+    for name, i in ( ('testSlices.dat', 0), ('femurSlices.dat', 30) ):
+        stack = slices.loadSlices( os.path.join( here, name ) )
+        pairs.append( ( stack[i].coords, stack[i+1].coords ) )
+
+    for n0, n1 in ( (1, 1), (1, 3), (2, 2), (3, 1), (3, 7), (2, 40), (40, 45), (5, 120) ):
+        pairs.append( ( slices.makeCoords( syntheticContour( n0, 0.5, 5.0, 0.0 ) ),
+                        slices.makeCoords( syntheticContour( n1, -0.5, 6.0, 1.0 ) ) ) )
+
+    return pairs
+
+
+def availableBackends():
+
+    return sorted( b for b in slices.fillBackends if slices.np is not None or not b.startswith( 'numpy' ) )
+
+
+# Every fill backend, and the banded fill, gives the pure-Python
+# reference's tiling (optimal=True only on the smaller pairs, as it
+# tiles once per point)
+
+def testBackendsAgree():
+
+    for coords0, coords1 in contourPairs():
+        for optimal in ( (False, True) if len(coords1) <= 50 else (False,) ):
+
+            reference = slices.tilePair( coords0, coords1, 'python', optimal=optimal )
+
+            for backend in availableBackends():
+                assert slices.tilePair( coords0, coords1, backend, optimal=optimal ) == reference, ( backend, len(coords0), len(coords1) )
+
+            assert slices.tilePair( coords0, coords1, optimal=optimal, band=16 ) == reference, ( 'band', len(coords0), len(coords1) )
+
+
+# Volume enclosed by the tiling of one pair, with the ends capped
+
+def tiledVolume( slice0, slice1, **kw ):
+
+    mesh = slices.Mesh( [ slice0, slice1 ] )
+    mesh.addPair( 0, slices.tilePair( slice0.coords, slice1.coords, **kw ) )
+
+    return mesh.close()['volume']
+
+
+# The 'volume' cost's tiling encloses at least as much as the 'area'
+# cost's, with every backend
+
+def testVolumeCost():
+
+    femur = slices.loadSlices( os.path.join( here, 'femurSlices.dat' ) )
+
+    pairs = [ ( slices.Slice( syntheticContour( 40, 0.5, 5.0, 0.0 ) ), slices.Slice( syntheticContour( 45, -0.5, 5.0, 1.3 ) ) ),
+              ( femur[10], femur[11] ),
+              ( femur[40], femur[41] ) ]
+
+    for slice0, slice1 in pairs:
+
+        area = tiledVolume( slice0, slice1, cost='area' )
+
+        for backend in availableBackends():
+            assert tiledVolume( slice0, slice1, cost='volume', backend=backend ) >= area - 1e-9 * abs( area )
+
+        assert tiledVolume( slice0, slice1, cost='volume', band=16 ) >= area - 1e-9 * abs( area )
+
+
+# A slice stack whose header claims more slices than its offset table
+# holds is reported as truncated
+
+def testTruncatedStack():
+
+    header = slices.stackHeader.pack( slices.stackMagic, slices.stackVersion, 4, 255, 0 )
+
+    for data in ( header, header + bytes( 16 ) ):
+        try:
+            slices.SliceStack( data )
+        except ValueError as e:
+            assert 'truncated' in str( e )
+        else:
+            assert False, 'no error for a truncated stack'
+
+
+# Tilings saved by a TilingCache are read back by another one on the
+# same directory, and a file that does not decode is a miss
+
+def testTilingCacheFiles():
+
+    femur = slices.loadSlices( os.path.join( here, 'femurSlices.dat' ) )
+    tris  = slices.tilePair( femur[0].coords, femur[1].coords )
+    key   = slices.tilingKey( femur[0].coords, femur[1].coords )
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        slices.TilingCache( directory=directory ).put( key, tris )
+        assert slices.TilingCache( directory=directory ).get( key ) == tris
+
+        with open( slices.TilingCache( directory=directory ).entryPath( key ), 'ab' ) as f:
+            f.write( b'\x80' )
+        assert slices.TilingCache( directory=directory ).get( key ) is None
+
+
+# A cache with room for every pair of a stack (as the viewer makes it)
+# has them all on the next run, even past the default 256 entries
+
+def testTilingCacheStack():
+
+    stack = syntheticStack( 300, 30 )
+    cache = slices.TilingCache( len(stack) )
+
+    first = slices.buildMesh( stack, cache=cache )
+    hits  = cache.hits
+    again = slices.buildMesh( stack, cache=cache )
+
+    assert cache.hits - hits == len(stack) - 1
+    assert [ tuple(t) for t in again.tris ] == [ tuple(t) for t in first.tris ]
+
+
+
+if __name__ == '__main__':
+
+    for name, check in sorted( globals().items() ):
+        if name.startswith( 'test' ) and callable( check ):
+            check()
+            print( '%s ok' % name )
@@ -0,0 +1,1055 @@
+# OpenGL/GLFW viewer for slices and their triangulation
+#
+# This is kept apart from slices.py so that reading and meshing can
+# run on machines without PyOpenGL or GLFW.  It is only imported when
+# the viewer is launched.
+
+haveGlutForFonts = False  
+
+import sys, math, time, ctypes, threading, traceback
+
+try: # PyOpenGL
+    from OpenGL.GL import *
+    from OpenGL.GLU import *
+except:
+    print( 'Error: PyOpenGL has not been installed.' )
+    sys.exit(0)
+
+try: # GLFW
+    import glfw
+except:
+    print( 'Error: GLFW has not been installed.' )
+    sys.exit(0)
+
+
+if haveGlutForFonts:
+    try: # GLUT
+      from OpenGL.GLUT import *
+    except:
+      print( 'Error: Could not import OpenGL.GLUT.  Set haveGlutForFonts = False unless you can install GLUT.' )
+      sys.exit(0)
+
+import slices
+from slices import np, TilingCache, MeshTriangles, timed, enableStats, buildMesh, buildBranchingMesh, iterMesh, iterBranchingMesh, groupLayers, closeSummary, coarseLayers, contourHeight, showProgress, loadSlices
+from geometry import add, adds, subtract, scalarMult, scalarMults, crossProduct, length, normalize, rotateVector, edgeVectors
+
+
+# Globals
+
+windowWidth  = 800
+windowHeight = 800
+window       = None
+
+allSlices    = []
+allTriangles = []
+allLayers    = None # allSlices grouped by height, if some height has several contours
+
+showCurrentSlice = False
+labelVerts       = False
+labelEdges       = False
+labelTris        = False
+showOverlay      = False
+currentSlice     = 0
+
+numWorkers       = None  # processes used to triangulate all slices (None = one per CPU)
+optimalTiling    = False # minimum-area tiling over all starting edges
+tilingCache      = None  # TilingCache of slice pair tilings, so that 'c' only retiles pairs that changed
+closeMeshes      = True  # cap the ends of the whole-stack mesh and orient it outward (see Mesh.close())
+
+lastCompute      = None  # ( seconds, { timer name: seconds } ) for the last 'c'
+
+
+# Draw a slice
+    
+def drawSlice( slice ):
+
+    glColor3f( 0, 0, 0 );
+
+    # Draw points
+    
+    # glBegin( GL_POINTS )
+    # for v in slice.verts:
+    #     glVertex3fv( v.coords )
+    # glEnd()
+
+    # Draw segments that fade from dark (0,0,0) at tail to light
+    # (1,1,1) at head so that direction can been seen.
+
+    glBegin( GL_LINES )
+    for v in slice.verts:
+        glColor3f( 0,0,0 )
+        glVertex3fv( v.coords )
+        glColor3f( 1,1,1 )
+        glVertex3fv( v.nextV.coords )
+    glEnd()
+
+
+# Draw a sequence of Triangles, each with its own normal
+
+def drawTriangleList( triangles ):
+
+    glBegin( GL_TRIANGLES )
+    for tri in triangles:
+        glNormal3fv( tri.norm )
+        glVertex3fv( tri.verts[0].coords )
+        glVertex3fv( tri.verts[1].coords )
+        glVertex3fv( tri.verts[2].coords )
+    glEnd()
+
+
+
+# Vertex buffers
+#
+# The triangles and the slice outlines are uploaded to the GPU once, as
+# interleaved float32 arrays, and drawn from there with one call each
+# frame.  They are uploaded again only when allTriangles or allSlices
+# is replaced.  Each triangle keeps its own three vertices, so that it
+# is lit with its own (flat) normal as before.  Without NumPy, drawing
+# falls back to immediate mode.
+
+class VertexBuffer(object):
+
+    # 'data' is an (N,6) float32 array of a position and then a normal
+    # (if 'attribute' is GL_NORMAL_ARRAY) or colour (GL_COLOR_ARRAY)
+    # per vertex
+
+    def __init__( self, data, attribute ):
+
+        self.count     = len(data)
+        self.attribute = attribute
+        self.id        = glGenBuffers( 1 )
+
+        glBindBuffer( GL_ARRAY_BUFFER, self.id )
+        glBufferData( GL_ARRAY_BUFFER, data.nbytes, np.ascontiguousarray( data, dtype=np.float32 ), GL_STATIC_DRAW )
+        glBindBuffer( GL_ARRAY_BUFFER, 0 )
+
+    def draw( self, mode, first=0, count=None ):
+
+        if count is None:
+            count = self.count - first
+
+        glBindBuffer( GL_ARRAY_BUFFER, self.id )
+        glEnableClientState( GL_VERTEX_ARRAY )
+        glEnableClientState( self.attribute )
+
+        glVertexPointer( 3, GL_FLOAT, 24, ctypes.c_void_p( 0 ) )
+        if self.attribute == GL_NORMAL_ARRAY:
+            glNormalPointer( GL_FLOAT, 24, ctypes.c_void_p( 12 ) )
+        else:
+            glColorPointer( 3, GL_FLOAT, 24, ctypes.c_void_p( 12 ) )
+
+        glDrawArrays( mode, first, count )
+
+        glDisableClientState( self.attribute )
+        glDisableClientState( GL_VERTEX_ARRAY )
+        glBindBuffer( GL_ARRAY_BUFFER, 0 )
+
+    def delete( self ):
+
+        glDeleteBuffers( 1, [ self.id ] )
+
+
+triangleBuffer  = None # VertexBuffer of allTriangles, for GL_TRIANGLES
+triangleSource  = None # the list it was made from
+outlineBuffer   = None # VertexBuffer of the outlines of allSlices, for GL_LINES
+outlineSource   = None # the slices it was made from
+outlineFirsts   = []   # outlineBuffer vertex where each slice starts, and one more
+
+
+# Positions and normals of the corners of a sequence of Triangles
+
+def triangleBufferData( triangles ):
+
+    data = np.empty( (len(triangles), 3, 6), dtype=np.float32 )
+
+    if isinstance( triangles, MeshTriangles ): # straight from the mesh's arrays, without making Triangles
+        mesh = triangles.mesh
+        data[:,:,:3] = mesh.coords[ mesh.tris ]
+        data[:,:,3:] = mesh.faceNormals()[:,None,:]
+    elif triangles:
+        data[:,:,:3] = [ [ v.coords for v in tri.verts ] for tri in triangles ]
+        data[:,:,3:] = np.array( [ tri.norm for tri in triangles ] )[:,None,:]
+
+    return data.reshape( -1, 6 )
+
+
+# Positions and colours of the ends of each slice edge, dark at the
+# tail and light at the head (see drawSlice()), and the vertex where
+# each slice starts
+
+def outlineBufferData( slices ):
+
+    parts  = []
+    firsts = [ 0 ]
+
+    for slice in slices:
+
+        coords = np.asarray( slice.coords, dtype=np.float32 ).reshape( -1, 3 )
+
+        edges = np.zeros( (len(coords), 2, 6), dtype=np.float32 )
+        edges[:,0,:3] = coords
+        edges[:,1,:3] = np.roll( coords, -1, axis=0 )
+        edges[:,1,3:] = 1
+
+        parts.append( edges.reshape( -1, 6 ) )
+        firsts.append( firsts[-1] + 2 * len(coords) )
+
+    return np.concatenate( parts ) if parts else np.zeros( (0,6), dtype=np.float32 ), firsts
+
+
+# Make sure that the buffers hold the current triangles and slices
+
+def updateBuffers():
+
+    global triangleBuffer, triangleSource, outlineBuffer, outlineSource, outlineFirsts
+
+    if triangleSource is not allTriangles:
+        if triangleBuffer is not None:
+            triangleBuffer.delete()
+        triangleBuffer = VertexBuffer( triangleBufferData( allTriangles ), GL_NORMAL_ARRAY )
+        triangleSource = allTriangles
+
+    if outlineSource is not allSlices:
+        if outlineBuffer is not None:
+            outlineBuffer.delete()
+        data, outlineFirsts = outlineBufferData( allSlices )
+        outlineBuffer = VertexBuffer( data, GL_COLOR_ARRAY )
+        outlineSource = allSlices
+
+
+
+# Level of detail
+#
+# A big stack is slow to turn at full detail, so while a mouse button
+# is held the view is drawn from a coarser level when one is fine
+# enough at the current zoom.  Level l keeps every 2**l-th layer, with
+# each contour decimated to within half the new layer spacing, and once
+# 'c' has computed the whole mesh, a tiling of those.  The coarsest
+# level whose layer spacing is under lodPixels pixels on the screen is
+# drawn.  When the button is released the view is drawn at full detail
+# again.
+
+lodPixels    = 3  # largest layer spacing on the screen, in pixels, for a coarse level
+detailLevels = [] # DetailLevel for each coarse level, finest first
+
+
+class DetailLevel(object):
+
+    def __init__( self, layers, step, spacing ):
+
+        self.step      = step
+        self.spacing   = step * spacing # between its layers
+        self.layers    = coarseLayers( layers, step, self.spacing / 2 )
+        self.slices    = [ contour for layer in self.layers for contour in layer ]
+        self.triangles = []   # its tiling, once computed
+        self.source    = None # the allTriangles that it goes with
+
+        self.outlineBuffer  = None # VertexBuffers, made when first drawn
+        self.triangleBuffer = None
+
+    # Tiling of this level, made as 'c' makes the whole stack's (this
+    # runs in the MeshJob's thread)
+
+    def tile( self, branching, optimal, close ):
+
+        if branching:
+            mesh = buildBranchingMesh( self.layers, optimal=optimal, cache=tilingCache )
+        else:
+            mesh = buildMesh( self.slices, optimal=optimal, cache=tilingCache )
+
+        if close:
+            mesh.close()
+
+        return mesh.triangles()
+
+    # Draw 'triangles' from tile() for this level while 'source' is allTriangles
+
+    def use( self, triangles, source ):
+
+        self.triangles = triangles
+        self.source    = source
+
+        if self.triangleBuffer is not None:
+            self.triangleBuffer.delete()
+            self.triangleBuffer = None
+
+    def drawOutlines( self ):
+
+        if np is None:
+            for slice in self.slices:
+                drawSlice( slice )
+        else:
+            if self.outlineBuffer is None:
+                self.outlineBuffer = VertexBuffer( outlineBufferData( self.slices )[0], GL_COLOR_ARRAY )
+            self.outlineBuffer.draw( GL_LINES )
+
+    def drawTriangles( self ):
+
+        if np is None:
+            drawTriangleList( self.triangles )
+        else:
+            if self.triangleBuffer is None:
+                self.triangleBuffer = VertexBuffer( triangleBufferData( self.triangles ), GL_NORMAL_ARRAY )
+            self.triangleBuffer.draw( GL_TRIANGLES )
+
+
+# Coarse levels for allSlices, down to three layers
+
+def makeDetailLevels():
+
+    layers  = allLayers if allLayers is not None else [ [ slice ] for slice in allSlices ]
+    spacing = abs( contourHeight( layers[-1][0] ) - contourHeight( layers[0][0] ) ) / (len(layers) - 1)
+
+    levels = []
+    step   = 2
+
+    while spacing > 0 and step <= (len(layers) - 1) // 2:
+        levels.append( DetailLevel( layers, step, spacing ) )
+        step *= 2
+
+    return levels
+
+
+# The level to draw now, or None for full detail
+
+def currentDetail():
+
+    if button is None or showCurrentSlice or labelVerts or labelEdges or labelTris:
+        return None
+
+    zoomedFovy = fovy + fovyDelta if fovyDelta is not None else fovy
+    pixelSize  = 2 * length( subtract( eye, lookat ) ) * math.tan( math.radians( zoomedFovy ) / 2 ) / windowHeight
+
+    chosen = None
+    for level in detailLevels:
+        if level.spacing <= lodPixels * pixelSize:
+            chosen = level
+
+    return chosen
+
+
+
+# Set up the display and draw the current image
+
+fovy  = 6     # field-of-view
+fNear = 10    # near plane
+fFar  = 10000 # far plane
+
+eye    = [100,100,1000]
+lookat = [0,0,0]
+updir  = [0,1,0]
+
+rotationAngle = None
+rotationAxis  = None
+fovyDelta     = None
+
+
+def display():
+
+    # Set up window
+
+    glClearColor( 1,1,1,0 )
+    glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT );
+    glEnable( GL_DEPTH_TEST )
+    glPolygonMode( GL_FRONT_AND_BACK, GL_FILL )
+
+    # Apply zoom to fovy
+
+    glMatrixMode( GL_PROJECTION )
+    glLoadIdentity()
+
+    if fovyDelta is not None:
+        zoomedFovy = fovy + fovyDelta
+    else:
+        zoomedFovy = fovy
+
+    gluPerspective( zoomedFovy, float(windowWidth) / float(windowHeight), fNear, fFar );
+
+    # Apply rotation to eye position
+
+    if rotationAngle is None:
+        rotatedEye = eye
+        rotatedUp  = updir
+    else:
+        rotatedEye = rotateVector( eye,   rotationAngle, rotationAxis )
+        rotatedUp  = rotateVector( updir, rotationAngle, rotationAxis )
+
+    glMatrixMode( GL_MODELVIEW )
+    glLoadIdentity()
+
+    gluLookAt( rotatedEye[0], rotatedEye[1], rotatedEye[2],
+	       lookat[0],     lookat[1],     lookat[2],
+	       rotatedUp[0],  rotatedUp[1],  rotatedUp[2] );
+
+    # Draw slices
+
+    if showCurrentSlice:
+        slicesToDraw = [ allSlices[currentSlice], allSlices[currentSlice+1] ]
+    else:
+        slicesToDraw = allSlices
+
+    if np is not None:
+        updateBuffers()
+
+    level = currentDetail()
+
+    if len(allTriangles) == 0 or meshJob is not None: # draw the EDGES of each slice
+        if level is not None:
+            level.drawOutlines()
+        elif np is None:
+            for slice in slicesToDraw:
+                drawSlice( slice )
+        elif showCurrentSlice:
+            first = outlineFirsts[currentSlice]
+            outlineBuffer.draw( GL_LINES, first, outlineFirsts[currentSlice+2] - first )
+        else:
+            outlineBuffer.draw( GL_LINES )
+
+    # Set up lighting for triangles
+
+    lightDir = add( scalarMult( 5, normalize( rotatedEye ) ), # light is above and right of viewer
+                    add( normalize( rotatedUp ), 
+                         normalize( crossProduct( rotatedUp, rotatedEye ) ) ) )
+
+    glLightfv( GL_LIGHT0, GL_POSITION, lightDir + [0.0] )
+
+    glLightfv( GL_LIGHT0, GL_AMBIENT,  [ 0.2, 0.2, 0.2, 0.0 ] )
+    glLightfv( GL_LIGHT0, GL_DIFFUSE,  [ 1.0, 1.0, 1.0, 0.0 ] )
+    glLightfv( GL_LIGHT0, GL_SPECULAR, [ 1.0, 1.0, 1.0, 0.0 ] )
+
+    glEnable( GL_LIGHT0 )
+
+    glLightModeli( GL_LIGHT_MODEL_TWO_SIDE, GL_TRUE )
+
+    # Draw triangles
+
+    glEnable( GL_LIGHTING )
+
+    if level is not None and level.source is allTriangles:
+        level.drawTriangles()
+    elif np is not None:
+        triangleBuffer.draw( GL_TRIANGLES )
+    else:
+        drawTriangleList( allTriangles )
+
+    glDisable( GL_LIGHTING )
+
+    # Draw axes (x=red, y=green, z=blue)
+
+    glLineWidth( 3.0 )
+    glBegin( GL_LINES )
+
+    l = 10 # axis length
+
+    glColor3fv( [1,0,0] )  # x
+    glVertex3fv( [0,0,0] )
+    glVertex3fv( [l,0,0] )
+
+    glColor3fv( [0,1,0] )  # y
+    glVertex3fv( [0,0,0] )
+    glVertex3fv( [0,l,0] )
+
+    glColor3fv( [0,0,1] )  # z
+    glVertex3fv( [0,0,0] )
+    glVertex3fv( [0,0,l] )
+
+    glEnd()
+    glLineWidth( 1.0 )
+
+    # Draw labels
+
+    glDisable( GL_DEPTH_TEST )
+
+    if labelVerts:
+        glColor3f(0,0,0)
+        for slice in slicesToDraw:
+            for vert in slice.verts:
+                drawText( vert.coords, repr(vert) )
+    
+    if labelEdges:
+        glColor3f(0,0,0)
+        for slice in slicesToDraw:
+            midpoints = adds( slice.coords, scalarMults( 0.5, edgeVectors( slice.coords ) ) )
+            for vert, midpoint in zip( slice.verts, midpoints ):
+                drawText( midpoint, ('%s-%s' % (repr(vert),repr(vert.nextV))) )
+    
+    if labelTris:
+        glColor3f(0,0,0)
+        for tri in allTriangles:
+            drawText( scalarMult( 0.3333, add( tri.verts[0].coords, add( tri.verts[1].coords, tri.verts[2].coords ) ) ), repr(tri) )
+
+    if showOverlay:
+        drawOverlay()
+    
+    # Show window
+
+    glfw.swap_buffers( window )
+
+    
+
+# Timing overlay: the last compute (split into the instrumented steps
+# that ran in this process) and the last frame time.  The text goes in
+# the window's corner if GLUT is available for fonts, else in its title.
+
+def overlayText():
+
+    text = 'frame %.1f ms' % (1000 * frameStats.lastTime)
+
+    level = currentDetail()
+    if level is not None:
+        text += ', every %d layers' % level.step
+
+    if meshProgress is not None:
+        text = 'meshing %d of %d pairs   %s' % (meshProgress + (text,))
+
+    if lastCompute is not None:
+        seconds, steps = lastCompute
+        parts = [ '%s %.0f' % (name, 1000 * steps[name]) for name in sorted( steps ) if steps[name] > 0.0005 ]
+        text  = 'compute %.0f ms%s   %s' % (1000 * seconds, ' (%s)' % ', '.join( parts ) if parts else '', text)
+
+    return text
+
+
+def drawOverlay():
+
+    text = overlayText()
+
+    if haveGlutForFonts:
+        glColor3f( 0,0,0 )
+        glWindowPos2i( 8, 8 )
+        for ch in text:
+            glutBitmapCharacter( GLUT_BITMAP_8_BY_13, ord(ch) )
+    else:
+        glfw.set_window_title( window, '3D Meshing - ' + text )
+
+
+
+def drawText( coords, text ):
+
+    if haveGlutForFonts:
+        glRasterPos3fv( coords )
+        for ch in text:
+            glutBitmapCharacter( GLUT_BITMAP_8_BY_13, ord(ch) )
+
+
+
+# Background meshing
+#
+# 'c' starts a MeshJob, which tiles in a thread (and from there in the
+# process pool, with workers) so that the window keeps responding.
+# While it runs, the event loop wakes every partialInterval seconds and
+# shows the mesh so far (see updateMeshJob()), with the slice outlines.
+# Pressing 'c' again, or 's', cancels the job: it stops after the pair
+# it is tiling, and the pairs that no worker has started are dropped.
+# The thread makes no GL calls; the finished mesh and the detail
+# levels' tilings are put into the view by the main thread.
+
+meshJob         = None # the running MeshJob
+meshProgress    = None # ( done, total ) pairs of meshJob, as last shown
+partialInterval = 0.1  # seconds between showing a running job's mesh so far
+
+
+class MeshJob(object):
+
+    # Tile 'layers' (lists of contours), or with pair=True the two slices
+    # in 'layers' as one pair
+
+    def __init__( self, layers, pair ):
+
+        self.cancelled = threading.Event()
+        self.progress  = None # ( mesh, done, total ), with the mesh as it grows
+        self.shown     = None # the progress last shown
+        self.result    = None # ( mesh, detail level tilings, close report, compute timing ) when done
+        self.failed    = False
+
+        self.thread = threading.Thread( target=self.run, daemon=True,
+                                        args=( layers, pair, allLayers is not None, optimalTiling, closeMeshes ) )
+        self.thread.start()
+
+    def cancel( self ):
+
+        self.cancelled.set()
+
+    def run( self, layers, pair, branching, optimal, close ):
+
+        before = slices.stats.totals()
+        start  = time.perf_counter()
+
+        try:
+            with timed( 'compute' ):
+
+                if branching and not pair:
+                    steps = iterBranchingMesh( layers, workers=numWorkers, optimal=optimal, cache=tilingCache )
+                else:
+                    steps = iterMesh( [ layer[0] for layer in layers ], workers=1 if pair else numWorkers, optimal=optimal, cache=tilingCache )
+
+                try:
+                    for mesh, done, total in steps:
+                        if self.cancelled.is_set():
+                            return
+                        self.progress = ( mesh, done, total )
+                        if done and not pair:
+                            showProgress( done, total )
+                finally:
+                    steps.close() # stops the tiling if cancelled
+
+                if pair:
+                    report, tilings = None, []
+                else:
+                    sys.stdout.write( '\r          \n' )
+                    report = mesh.close() if close else None
+                    with timed( 'detail levels' ):
+                        tilings = [ level.tile( branching, optimal, close ) for level in detailLevels ]
+
+            after  = slices.stats.totals()
+            timing = ( time.perf_counter() - start,
+                       { name: after[name] - before.get( name, 0.0 ) for name in after if name not in ('compute', 'display') } )
+
+            if not self.cancelled.is_set():
+                self.result = ( mesh, tilings, report, timing )
+
+        except Exception:
+            traceback.print_exc()
+            self.failed = True
+
+        finally:
+            glfw.post_empty_event() # wake the event loop to take the result
+
+
+# Start meshing what is shown: the current pair of slices, or the whole stack
+
+def startMeshJob():
+
+    global meshJob, meshProgress
+
+    if showCurrentSlice:
+        meshJob = MeshJob( [ [ allSlices[currentSlice] ], [ allSlices[currentSlice+1] ] ], True )
+    else:
+        meshJob = MeshJob( allLayers if allLayers is not None else [ [ slice ] for slice in allSlices ], False )
+
+    meshProgress = None
+
+
+def cancelMeshJob():
+
+    global meshJob, meshProgress
+
+    if meshJob is not None:
+        meshJob.cancel()
+        meshJob      = None
+        meshProgress = None
+        sys.stdout.write( '\r          \n' )
+        print( 'meshing cancelled' )
+
+
+# Put the running job's mesh so far, or its result, into the view
+
+def updateMeshJob():
+
+    global meshJob, meshProgress, allTriangles, lastCompute
+
+    if meshJob is None:
+        return
+
+    if meshJob.result is not None:
+
+        mesh, tilings, report, lastCompute = meshJob.result
+
+        allTriangles = mesh.triangles()
+        for level, triangles in zip( detailLevels, tilings ):
+            level.use( triangles, allTriangles )
+
+        if report is not None:
+            print( closeSummary( report ) )
+
+        meshJob      = None
+        meshProgress = None
+
+    elif meshJob.failed:
+
+        meshJob      = None
+        meshProgress = None
+
+    elif meshJob.progress is not meshJob.shown:
+
+        mesh, done, total = meshJob.shown = meshJob.progress
+
+        if done > 0:
+            allTriangles = mesh.snapshot().triangles()
+
+        meshProgress = ( done, total )
+
+
+
+# Handle keyboard input
+
+def keyCallback( window, key, scancode, action, mods ):
+
+    global currentSlice, showCurrentSlice, labelVerts, labelEdges, labelTris, optimalTiling, closeMeshes, showOverlay
+    
+    if action == glfw.PRESS:
+    
+        if key == glfw.KEY_ESCAPE: # quit upon ESC
+            sys.exit(0)
+
+        elif key == ord('C'): # compute min-area triangulation (in the background), or cancel it
+
+            if meshJob is not None:
+                cancelMeshJob()
+            else:
+                startMeshJob()
+
+        elif key == ord('O'): # toggle optimal tiling for the next 'c'
+            optimalTiling = not optimalTiling
+            print( 'optimal tiling %s' % ('on' if optimalTiling else 'off') )
+
+        elif key == ord('W'): # toggle capping (watertight meshes) for the next 'c'
+            closeMeshes = not closeMeshes
+            print( 'capping %s' % ('on' if closeMeshes else 'off') )
+
+        elif key == ord('S'): # show current slice
+            cancelMeshJob()
+            showCurrentSlice = not showCurrentSlice
+
+        elif key == ord(','): # current slice moves up
+            if currentSlice > 0:
+                currentSlice -= 1
+            
+        elif key == ord('.'): # current slice moves down
+            if currentSlice < len(allSlices)-2:
+                currentSlice += 1
+
+        elif key == ord('V'): # toggle vertex labels
+            labelVerts = not labelVerts
+
+        elif key == ord('E'): # toggle edge labels
+            labelEdges = not labelEdges
+
+        elif key == ord('T'): # toggle triangle labels
+            labelTris = not labelTris
+
+        elif key == ord('I'): # toggle the timing overlay
+            showOverlay = not showOverlay
+            if not showOverlay and not haveGlutForFonts:
+                glfw.set_window_title( window, '3D Meshing' )
+
+        elif key == ord('F'): # print frame stats since the last 'f'
+            print( frameStats.report() )
+            frameStats.reset()
+
+        elif key == ord('/'):
+
+            print( 'keys: c - compute min-area triangulation (again to cancel)' )
+            print( '      o - toggle optimal tiling over all starting edges' )
+            print( '      w - toggle capping the ends of the whole-stack mesh' )
+            print( '      s - toggle current slice' )
+            print( '      < - current slice moves up' )
+            print( '      > - current slice moves down' )
+            print( '      v - toggle vertex labels' )
+            print( '      e - toggle edge labels' )
+            print( '      t - toggle triangle labels' )
+            print( '      f - print frame stats' )
+            print( '      i - toggle timing overlay' )
+            print( '' )
+            print( 'mouse: drag left button          - rotate' )
+            print( '       drag right button up/down - zoom' )
+
+
+
+# Handle window reshape
+
+def windowReshapeCallback( window, newWidth, newHeight ):
+
+    global windowWidth, windowHeight
+
+    windowWidth  = newWidth
+    windowHeight = newHeight
+
+
+
+# Handle mouse click/release
+
+initX  = 0
+initY  = 0
+button = None
+
+def mouseButtonCallback( window, btn, action, keyModifiers ):
+
+    global button, initX, initY, eye, updir, fovy, rotationAngle, rotationAxis, fovyDelta
+
+    if action == glfw.PRESS:
+
+        button = btn
+        initX, initY = glfw.get_cursor_pos( window ) # store mouse position
+
+        rotationAngle = 0
+        rotationAxis  = [1,0,0]
+
+    elif action == glfw.RELEASE:
+
+        if rotationAngle is not None:
+            eye   = rotateVector( eye, rotationAngle, rotationAxis )
+            updir = rotateVector( updir, rotationAngle, rotationAxis )
+
+        if fovyDelta is not None:
+            fovy = fovy + fovyDelta
+
+        button        = None
+        rotationAngle = None
+        fovyDelta     = None
+
+    
+
+# Handle mouse motion.  We don't want to transform the image and
+# redraw with each tiny mouse movement.  Instead, just record the fact
+# that the mouse moved.  After events are processed in
+# glfw.wait_events(), check whether the mouse moved and, if so, act on
+# it.
+
+
+mousePositionChanged = False
+
+def mouseMovementCallback( window, x, y ):
+
+  global mousePositionChanged
+
+  if button is not None: # button is held down
+      mousePositionChanged = True
+
+
+
+def actOnMouseMovement( window, button, x, y ):
+
+    global currentImage, rotationAngle, rotationAxis, fovyDelta
+
+    if button == glfw.MOUSE_BUTTON_LEFT:
+
+        # rotate viewpoint
+
+        # Get initial vector from (0,0,0) to mouse
+      
+        x0 =   (initX - float(windowWidth)/2.0)  / (float(windowWidth)/2.0)
+        y0 = - (initY - float(windowHeight)/2.0) / (float(windowHeight)/2.0)
+
+        dSquared = x0*x0 + y0*y0
+        if dSquared > 1:
+            d = math.sqrt(dSquared)
+            x0 /= d
+            y0 /= d
+            dSquared = 1
+
+        z0 = math.sqrt( 1 - dSquared )
+
+        # Get current vector from (0,0,0) to mouse
+        
+        x1 =   (x - float(windowWidth)/2.0)  / (float(windowWidth)/2.0)
+        y1 = - (y - float(windowHeight)/2.0) / (float(windowHeight)/2.0)
+
+        dSquared = x1*x1 + y1*y1
+        if dSquared > 1:
+            d = math.sqrt(dSquared)
+            x1 /= d
+            y1 /= d
+            dSquared = 1
+
+        z1 = math.sqrt( 1 - dSquared )
+
+        # Find rotation angle and axis (in coordinate system aligned with window x and y)
+
+        angleCos = x0*x1 + y0*y1 + z0*z1
+
+        if angleCos > 1:
+            angleCos = 1
+        elif angleCos < -1:
+            angleCos = -1
+
+        rotationAngle = math.acos( angleCos )
+
+        if abs(rotationAngle) < 0.0001:
+            rotationAngle = 0
+            rotationAxis = [ 1,0,0 ]
+        else:
+            rotationAxis = crossProduct( [x0,y0,z0], [x1,y1,z1] )
+            d = math.sqrt( rotationAxis[0]*rotationAxis[0] + rotationAxis[1]*rotationAxis[1] + rotationAxis[2]*rotationAxis[2] )
+            rotationAxis = [ rotationAxis[0]/d, rotationAxis[1]/d, rotationAxis[2]/d ]
+
+        # Move rotation axis into world coordinate system
+
+        eyeZ = normalize( [ eye[0]-lookat[0], eye[1]-lookat[1], eye[2]-lookat[2] ] )
+        eyeX = normalize( crossProduct( eyeZ, updir ) )
+        eyeY = normalize( crossProduct( eyeZ, eyeX ) )
+
+        rotationAxis = [ rotationAxis[0] * eyeX[0] + rotationAxis[1] * eyeY[0] + rotationAxis[2] * eyeZ[0],
+                         rotationAxis[0] * eyeX[1] + rotationAxis[1] * eyeY[1] + rotationAxis[2] * eyeZ[1],
+                         rotationAxis[0] * eyeX[2] + rotationAxis[1] * eyeY[2] + rotationAxis[2] * eyeZ[2] ]
+
+    elif button == glfw.MOUSE_BUTTON_RIGHT:
+
+        # zoom viewpoint
+
+        fovyDelta = (initY - y) / float(windowHeight) * fovy
+
+
+
+# Redraw on demand
+#
+# The window is only redrawn when something that shows in it has
+# changed since the last frame (see viewState()), or when the window
+# system asks for it, so an idle viewer does no drawing at all.
+# Bursts of mouse movements are coalesced: only the latest position is
+# acted on after glfw.wait_events() returns.
+
+needsRedraw = True # set when the window must be redrawn whatever the state
+drawnState  = None # viewState() when the window was last drawn
+
+
+# Everything that display() depends on
+
+def viewState():
+
+    return ( rotationAngle, rotationAxis and tuple(rotationAxis), fovyDelta, fovy, tuple(eye), tuple(updir),
+             windowWidth, windowHeight, showCurrentSlice, currentSlice, labelVerts, labelEdges, labelTris,
+             showOverlay, lastCompute, id(allTriangles), id(allSlices), id(currentDetail()), meshProgress )
+
+
+def windowRefreshCallback( window ):
+
+    global needsRedraw
+
+    needsRedraw = True
+
+
+# Frame times, and how often the event loop woke up, so that it can be
+# seen that an idle viewer is not drawing
+
+class FrameStats(object):
+
+    def __init__( self ):
+        self.reset()
+
+    def reset( self ):
+
+        self.frames    = 0
+        self.wakeups   = 0
+        self.totalTime = 0.0
+        self.maxTime   = 0.0
+        self.lastTime  = 0.0
+        self.startTime = time.time()
+
+    def addFrame( self, seconds ):
+
+        self.frames    += 1
+        self.totalTime += seconds
+        self.maxTime    = max( self.maxTime, seconds )
+        self.lastTime   = seconds
+
+    def report( self ):
+
+        elapsed = time.time() - self.startTime
+        mean    = self.totalTime / self.frames if self.frames else 0.0
+
+        return ( '%d frames, %d wakeups in %.1f s; frame time mean %.1f ms, max %.1f ms, last %.1f ms; busy %.1f%%'
+                 % (self.frames, self.wakeups, elapsed, 1000*mean, 1000*self.maxTime, 1000*self.lastTime,
+                    100 * self.totalTime / elapsed if elapsed > 0 else 0.0) )
+
+
+frameStats = FrameStats()
+
+
+# Draw the window if anything has changed
+
+def redrawIfNeeded():
+
+    global needsRedraw, drawnState
+
+    state = viewState()
+
+    if needsRedraw or state != drawnState:
+
+        start = time.time()
+        with timed( 'display' ):
+            display()
+        frameStats.addFrame( time.time() - start )
+
+        needsRedraw = False
+        drawnState  = state
+
+
+
+# Initialize GLFW and run the main event loop
+
+def main( filename ):
+
+    global window, allSlices, allLayers, detailLevels, tilingCache, mousePositionChanged
+    
+    # Set up window
+  
+    if not glfw.init():
+        print( 'Error: GLFW failed to initialize' )
+        sys.exit(1)
+
+    if haveGlutForFonts:
+        glutInit()
+
+    window = glfw.create_window( windowWidth, windowHeight, "3D Meshing", None, None )
+
+    if not window:
+        glfw.terminate()
+        print( 'Error: GLFW failed to create a window' )
+        sys.exit(1)
+
+    glfw.make_context_current( window )
+    glfw.swap_interval( 1 )
+    glfw.set_key_callback( window, keyCallback )
+    glfw.set_window_size_callback( window, windowReshapeCallback )
+    glfw.set_mouse_button_callback( window, mouseButtonCallback )
+    glfw.set_cursor_pos_callback( window, mouseMovementCallback )
+    glfw.set_window_refresh_callback( window, windowRefreshCallback )
+
+    enableStats() # for the timing overlay
+
+    # Read the triangles.
+
+    allSlices = loadSlices( filename )
+
+    print( 'Read %d slices' % len(allSlices) )
+
+    if len(allSlices) < 2:
+        return
+
+    layers = list( groupLayers( allSlices ) )
+    if len(layers) < len(allSlices):
+        allLayers = layers
+        print( 'Grouped into %d layers (some heights have several contours)' % len(layers) )
+
+    detailLevels = makeDetailLevels()
+
+    # Room for every pair of the stack and of each detail level (a pair
+    # of layers tiles at most one pair per contour), so that the next
+    # 'c' finds them all rather than having pushed out the first ones
+
+    tilingCache = TilingCache( len(allSlices) + sum( len(level.slices) for level in detailLevels ) )
+
+    # Main event loop
+
+    redrawIfNeeded()
+
+    while not glfw.window_should_close( window ):
+
+        if meshJob is not None:
+            glfw.wait_events_timeout( partialInterval )
+        else:
+            glfw.wait_events()
+        frameStats.wakeups += 1
+
+        updateMeshJob()
+
+        if mousePositionChanged:
+          currentX, currentY = glfw.get_cursor_pos( window )
+          actOnMouseMovement( window, button, currentX, currentY )
+          mousePositionChanged = False
+          
+        redrawIfNeeded()
+
+    glfw.destroy_window( window )
+    glfw.terminate()